@@ -1,13 +1,13 @@
 # src/app/etl_runner.py
 import os
 import time
-import sqlite3
 import pandas as pd
 from datetime import datetime, timedelta, timezone
 from xml.etree import ElementTree as ET
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Tuple, Optional, Union
 
 from src.trv.client import TRVClient
+from src.trv.load_sqlite import ensure_schema, upsert_incidents
 
 API_KEY  = os.getenv("TRAFIKVERKET_API_KEY", "")
 BASE_URL = os.getenv("TRAFIKVERKET_URL", "https://api.trafikinfo.trafikverket.se/v2/data.xml")
@@ -68,8 +68,9 @@ def _derive_status(start_iso: str, end_iso: str) -> str:
     """Make 'PÅGÅR'/'KOMMANDE' from times if no Status provided."""
     try:
         now = datetime.now(timezone.utc)
-        start = datetime.fromisoformat(start_iso.replace("Z", "+00:00")) if start_iso else None
-        end   = datetime.fromisoformat(end_iso.replace("Z", "+00:00")) if end_iso else None
+        # fromisoformat accepts a trailing "Z" since Python 3.11, no replace() copy needed
+        start = datetime.fromisoformat(start_iso) if start_iso else None
+        end   = datetime.fromisoformat(end_iso) if end_iso else None
         if start and now < start:
             return "KOMMANDE"
         if start and (not end or start <= now <= end):
@@ -78,13 +79,13 @@ def _derive_status(start_iso: str, end_iso: str) -> str:
         pass
     return ""
 
-def _parse_xml(xml_text: str) -> List[Dict[str, Any]]:
+def _parse_xml(xml_body: Union[bytes, str]) -> List[Dict[str, Any]]:
     """
     Parse Situation payload where each Situation may contain multiple <Deviation>.
     We flatten each Deviation into one incident row.
     """
     rows: List[Dict[str, Any]] = []
-    root = ET.fromstring(xml_text)
+    root = ET.fromstring(xml_body)  # bytes: the parser decodes per the XML declaration
 
     for sit in root.findall(".//Situation"):
         sit_id  = _safe_text(sit, "Id")
@@ -161,64 +162,19 @@ def run_etl(db_path: str, days_back: int = 1) -> Dict[str, Any]:
 
     # Build and call
     payload_xml = _build_query_xml(days_back=days_back).replace("{API_KEY}", API_KEY)
-    xml_text = client.post(payload_xml)  # returns XML string
+    xml_body = client.post(payload_xml)  # returns raw XML bytes
 
     # Parse → rows → DataFrame
-    rows = _parse_xml(xml_text)
+    rows = _parse_xml(xml_body)
     df = pd.DataFrame(rows)
     if df.empty:
         return {"rows": 0, "pagar": 0, "kommande": 0, "seconds": round(time.time() - t0, 2)}
 
     df = _normalize_df(df)
 
-    # Upsert into SQLite
-    con = sqlite3.connect(db_path)
-    cur = con.cursor()
-    cur.execute("""
-        CREATE TABLE IF NOT EXISTS incidents (
-            incident_id TEXT PRIMARY KEY,
-            message TEXT,
-            message_type TEXT,
-            location_descriptor TEXT,
-            road_number TEXT,
-            county_name TEXT,
-            county_no INTEGER,
-            start_time_utc TEXT,
-            end_time_utc TEXT,
-            modified_time_utc TEXT,
-            latitude REAL,
-            longitude REAL,
-            status TEXT
-        )
-    """)
-
-    cols = [
-        "incident_id","message","message_type","location_descriptor","road_number",
-        "county_name","county_no","start_time_utc","end_time_utc","modified_time_utc",
-        "latitude","longitude","status"
-    ]
-    sql = """
-        INSERT INTO incidents (
-            incident_id,message,message_type,location_descriptor,road_number,
-            county_name,county_no,start_time_utc,end_time_utc,modified_time_utc,
-            latitude,longitude,status
-        ) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
-        ON CONFLICT(incident_id) DO UPDATE SET
-            message=excluded.message,
-            message_type=excluded.message_type,
-            location_descriptor=excluded.location_descriptor,
-            road_number=excluded.road_number,
-            county_name=excluded.county_name,
-            county_no=excluded.county_no,
-            start_time_utc=excluded.start_time_utc,
-            end_time_utc=excluded.end_time_utc,
-            modified_time_utc=excluded.modified_time_utc,
-            latitude=excluded.latitude,
-            longitude=excluded.longitude,
-            status=excluded.status
-    """
-    cur.executemany(sql, [tuple(r.get(c) for c in cols) for r in df.to_dict(orient="records")])
-    con.commit(); con.close()
+    # Upsert into SQLite (same schema/upsert as the CLI, incl. index + *_lc search columns)
+    ensure_schema(db_path)
+    upsert_incidents(db_path, df)
 
     pagar = int((df["status"] == "PÅGÅR").sum()) if "status" in df.columns else 0
     kommande = int((df["status"] == "KOMMANDE").sum()) if "status" in df.columns else 0
@@ -1,16 +1,26 @@
 # src/app/streamlit_app.py
-import os, json, sqlite3
-from itertools import cycle
+import os, json, base64, sqlite3
+import datetime as dt
+from itertools import cycle, islice
+from pathlib import Path
 
+import numpy as np
 import pandas as pd
+import polars as pl
 import streamlit as st
 import plotly.express as px
-from streamlit_plotly_events import plotly_events
 import plotly.graph_objects as go
 import pydeck as pdk
 
 st.set_page_config(page_title="TRV Väghändelser", layout="wide")
 DB_PATH = os.getenv("TRAFIK_DB_PATH", "trafik.db")
+# Laddarna nycklas på databasfilens version (_db_version); ttl täcker bara att 30-dagarsfönstret
+# (WINDOW_SQL) flyttar sig med klockan.
+DB_CACHE_TTL = 900
+# Copy-on-Write (standard från pandas 3): härledda frames delar data med load_data:s cachade frame
+# tills de skrivs, så att grunda kopior räcker och den cachade framen aldrig muteras.
+if int(pd.__version__.split(".")[0]) < 3:
+    pd.options.mode.copy_on_write = True
 
 # ---------------------- I18N ----------------------
 LANG = {
@@ -31,13 +41,13 @@ LANG = {
         "kpi_upcoming": "KOMMANDE",
         "kpi_total": "Totalt i urval",
         "approx_missing": "Visa saknade koordinater i länscentrum",
-        "bar_hdr": "Händelser per län – klicka för att filtrera",
+        "bar_hdr": "Händelser per län – filtrera med länsvalet under diagrammet",
         "bar_none": "Inga händelser i urvalet för att rita staplar.",
         "bar_all": "Visa alla län",
         "bar_title_all": "Alla län",
         "bar_title_top": "Topp 10 län med flest händelser",
-        "bar_click_filter": "Filter via klick: ",
-        "bar_clear": "Rensa klick-filter",
+        "bar_click_filter": "Filtrera på län",
+        "bar_clear": "Rensa länsfilter",
         "map_hdr": "Karta över aktiva händelser",
         "map_mode": "Kartläge",
         "map_modes": ["Prickar", "Heatmap", "Båda"],
@@ -47,6 +57,8 @@ LANG = {
         "map_no_geo": "Inga koordinater tillgängliga i nuvarande urval.",
         "map_point_size": "Punktstorlek (pixlar)",
         "map_heat_intensity": "Heatmap-intensitet",
+        "map_fast": "Snabb karta (HTML-inbäddning)",
+        "map_hex_radius": "Hexagonradie (m)",
         "map_tooltip": (
             "<b>{county_display}</b><br/>"
             "{road_number} – {location_descriptor}<br/>"
@@ -86,13 +98,13 @@ LANG = {
         "kpi_upcoming": "Upcoming",
         "kpi_total": "Total (filtered)",
         "approx_missing": "Show missing coordinates in county centers",
-        "bar_hdr": "Incidents per county – click to filter",
+        "bar_hdr": "Incidents per county – filter with the county picker below the chart",
         "bar_none": "No incidents to plot for current selection.",
         "bar_all": "Show all counties",
         "bar_title_all": "All counties",
         "bar_title_top": "Top 10 counties by incidents",
-        "bar_click_filter": "Click filter: ",
-        "bar_clear": "Clear click filter",
+        "bar_click_filter": "Filter counties",
+        "bar_clear": "Clear county filter",
         "map_hdr": "Map of active incidents",
         "map_mode": "Map mode",
         "map_modes": ["Dots", "Heatmap", "Both"],
@@ -102,6 +114,8 @@ LANG = {
         "map_no_geo": "No coordinates available for current selection.",
         "map_point_size": "Point size (px)",
         "map_heat_intensity": "Heatmap intensity",
+        "map_fast": "Fast map (HTML embed)",
+        "map_hex_radius": "Hexagon radius (m)",
         "map_tooltip": (
             "<b>{county_display}</b><br/>"
             "{road_number} – {location_descriptor}<br/>"
@@ -144,50 +158,255 @@ COUNTY_CENTER = {
     "Skåne län": (55.604, 13.003),
     "Västra Götalands län": (57.708, 11.974),
 }
+LAT_BY_COUNTY = {k: v[0] for k, v in COUNTY_CENTER.items()}
+LON_BY_COUNTY = {k: v[1] for k, v in COUNTY_CENTER.items()}
 
 # ---------------------- DATA ----------------------
-@st.cache_data(ttl=300)
-def load_data() -> pd.DataFrame:
-    cols = ["incident_id","message","message_type","location_descriptor","road_number",
-            "county_name","county_no","start_time_utc","end_time_utc","modified_time_utc",
-            "latitude","longitude","status"]
+# Visningsnamn för län direkt i SQL: county_name om satt, annars namnet för county_no, annars "Okänt län".
+COUNTY_DISPLAY_SQL = (
+    "COALESCE(NULLIF(TRIM(county_name), ''), CASE county_no "
+    + " ".join(f"WHEN {no} THEN '{name}'" for no, name in COUNTY_NAMES.items())
+    + " END, 'Okänt län')"
+)
+WINDOW_SQL = "start_time_utc > datetime('now', '-30 day')"
+# Gemener för fritextsökning som ETL:en skriver (samma som LC_COLS i src/trv/load_sqlite.py)
+LC_COLS = {"message_lc": "message", "loc_lc": "location_descriptor", "road_lc": "road_number"}
+SEARCH_COL = "search_lc"  # message ␟ location ␟ road i gemener (SEARCH_COL i load_sqlite.py)
+JULIAN_UNIX_EPOCH = 2440587.5
+TABLE_COLS = ["incident_id","message_type","status","county_display",
+              "road_number","location_descriptor",
+              "start_time_utc","end_time_utc","modified_time_utc","latitude","longitude"]
+
+@st.cache_resource(max_entries=1)
+def _connect(file_id: tuple | None) -> sqlite3.Connection:
+    """En delad, skrivskyddad anslutning för hela appen (sqlite3 är byggt trådsäkert, threadsafety=3).
+    Databasen öppnas via URI med mode=ro – ETL:en skriver fortfarande via sin egen anslutning.
+    Nycklas på filens identitet (st_dev, st_ino): när nattjobbet ersätter trafik.db via git pull blir
+    det en ny fil och en öppen anslutning skulle fortsätta läsa den gamla, borttagna. Ny identitet ger
+    en ny anslutning; den gamla trängs ut (max_entries=1) och stängs när den skräpsamlas."""
+    uri = Path(DB_PATH).resolve().as_uri() + "?mode=ro"
+    con = sqlite3.connect(uri, uri=True, check_same_thread=False)
+    # mmap + 64 MB sidcache + temp i minnet: sidorna ligger kvar varma mellan reruns
+    con.execute("PRAGMA query_only=1")
+    con.execute("PRAGMA mmap_size=268435456")
+    con.execute("PRAGMA cache_size=-65536")
+    con.execute("PRAGMA temp_store=MEMORY")
+    # SQLite:s lower()/LIKE viker bara ASCII – registrera Pythons lower så att å/ä/ö matchar
+    con.create_function("py_lower", 1, lambda s: s.lower() if isinstance(s, str) else s, deterministic=True)
+    return con
+
+def _db_version() -> tuple:
+    """(st_dev, st_ino, mtime_ns, storlek) för databasfilen och dess -wal – ett stat-anrop per fil och rerun.
+    Ingår i laddarnas cache-nycklar: en ny ETL-körning ger nya nycklar direkt, och så länge filen
+    är orörd återanvänds de typade resultaten även efter att ett kortare ttl skulle ha gått ut.
+    I WAL-läge hamnar skrivningarna i -wal tills checkpoint, därför räcker inte huvudfilen."""
+    out = []
+    for p in (DB_PATH, DB_PATH + "-wal"):
+        try:
+            st_ = os.stat(p)
+            out.append((st_.st_dev, st_.st_ino, st_.st_mtime_ns, st_.st_size))
+        except OSError:
+            out.append(None)
+    return tuple(out)
+
+def _db_connect(db_version: tuple) -> sqlite3.Connection:
+    """Anslutningen för databasfilen som db_version beskriver (huvudfilens st_dev/st_ino).
+    Skrivningar i samma fil syns i den öppna anslutningen; bara en utbytt fil kräver en ny."""
+    main = db_version[0]
+    return _connect(main[:2] if main else None)
+
+def _like(s: str) -> str:
+    """'%text%' för LIKE ... ESCAPE '\\' – % och _ i användarens text matchas bokstavligt."""
+    s = s.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{s}%"
+
+@st.cache_data(ttl=DB_CACHE_TTL)
+def load_filter_options(db_version: tuple) -> tuple:
+    """Län + min/max starttid för sidopanelen, via en liten aggregatfråga istället för hela urvalet."""
     try:
-        con = sqlite3.connect(DB_PATH)
-        df = pd.read_sql_query(
+        con = _db_connect(db_version)
+        rows = con.execute(
+            f"""
+            SELECT {COUNTY_DISPLAY_SQL} AS county_display,
+                   MIN(julianday(start_time_utc)), MAX(julianday(start_time_utc))
+            FROM incidents
+            WHERE {WINDOW_SQL}
+            GROUP BY 1
             """
-            SELECT incident_id, message, message_type, location_descriptor,
-                   road_number, county_name, county_no,
-                   start_time_utc, end_time_utc, modified_time_utc,
-                   latitude, longitude, status
+        ).fetchall()
+    except Exception:
+        return [], None, None  # load_data visar varningen
+
+    counties = sorted(r[0] for r in rows)
+    lows = [r[1] for r in rows if r[1] is not None]
+    highs = [r[2] for r in rows if r[2] is not None]
+    if not lows:
+        return counties, None, None
+    to_ts = lambda jd: pd.to_datetime(jd - JULIAN_UNIX_EPOCH, unit="D", utc=True)
+    return counties, to_ts(min(lows)), to_ts(max(highs))
+
+def _filter_where(con: sqlite3.Connection, status: tuple, counties: tuple, date_from: dt.date,
+                  date_to: dt.date, q: str, road: str, only_geo: bool) -> tuple[list, list]:
+    """WHERE-predikat + bundna parametrar för sidopanelens filter (delas av load_data och load_table)."""
+    where, params = [WINDOW_SQL], []
+    if status:
+        where.append(f"status IN ({','.join('?' * len(status))})")
+        params += list(status)
+    if counties:
+        where.append(f"{COUNTY_DISPLAY_SQL} IN ({','.join('?' * len(counties))})")
+        params += list(counties)
+    # Datumfönster: tiderna lagras med lokal offset (+01:00/+02:00/Z), så strängintervallet breddas ett dygn
+    # åt var håll (kan använda index på start_time_utc) och julianday() gör den exakta UTC-jämförelsen.
+    where.append("start_time_utc >= ? AND start_time_utc < ?")
+    params += [(date_from - dt.timedelta(days=1)).isoformat(), (date_to + dt.timedelta(days=2)).isoformat()]
+    where.append("julianday(start_time_utc) >= julianday(?) AND julianday(start_time_utc) < julianday(?)")
+    params += [date_from.isoformat(), (date_to + dt.timedelta(days=1)).isoformat()]
+    if only_geo:
+        where.append("latitude IS NOT NULL AND longitude IS NOT NULL")
+    if q or road:
+        # ETL:en skriver gemener i *_lc-kolumner; äldre databaser utan dem faller tillbaka på py_lower()
+        have = {r[1] for r in con.execute("PRAGMA table_info(incidents)")}
+        lc = {src: (col if col in have else f"py_lower({src})") for col, src in LC_COLS.items()}
+        if q and SEARCH_COL in have:
+            where.append(f"{SEARCH_COL} LIKE ? ESCAPE '\\'")
+            params.append(_like(q))
+        elif q:
+            where.append(
+                f"({lc['message']} LIKE ? ESCAPE '\\' OR {lc['location_descriptor']} LIKE ? ESCAPE '\\'"
+                f" OR {lc['road_number']} LIKE ? ESCAPE '\\')"
+            )
+            params += [_like(q)] * 3
+        if road:
+            where.append(f"{lc['road_number']} LIKE ? ESCAPE '\\'")
+            params.append(_like(road))
+    return where, params
+
+# cache_resource: samma DataFrame-objekt lämnas ut vid varje rerun (ingen pickle/kopia som med
+# cache_data). Kontrakt: anroparen muterar den aldrig på plats – filtrera till nya objekt eller ta
+# .copy(deep=False) innan kolumner skrivs.
+@st.cache_resource(ttl=DB_CACHE_TTL, max_entries=32)
+def load_data(db_version: tuple, status: tuple, counties: tuple, date_from: dt.date, date_to: dt.date,
+              q: str, road: str, only_geo: bool) -> pd.DataFrame:
+    """Hämtar bara raderna som matchar filtren – alla predikat körs i SQLite med bundna parametrar.
+    Bara kolumnerna som KPI/staplar/karta/trend/typer läser; message, county_name och county_no används
+    enbart i SQL och tabellen hämtar sina rader själv i load_table()."""
+    cols = ["incident_id","message_type","location_descriptor","road_number",
+            "start_time_utc","modified_time_utc","latitude","longitude","status","county_display","start_date","start_str","mod_str"]
+
+    try:
+        con = _db_connect(db_version)
+        where, params = _filter_where(con, status, counties, date_from, date_to, q, road, only_geo)
+        pl_df = pl.read_database(
+            f"""
+            SELECT incident_id, message_type, location_descriptor, road_number,
+                   start_time_utc, modified_time_utc,
+                   latitude, longitude, status,
+                   {COUNTY_DISPLAY_SQL} AS county_display
             FROM incidents
-            WHERE start_time_utc > datetime('now', '-30 day')
+            WHERE {" AND ".join(where)}
             """,
             con,
+            execute_options={"parameters": params},
+            schema_overrides={"latitude": pl.Float64, "longitude": pl.Float64},
         )
-        con.close()
     except Exception as e:
         st.warning(f"Databas kunde inte läsas ({e}). Visar tom vy.")
         return pd.DataFrame(columns=cols)
 
-    # dtypes
-    if "county_no" in df: df["county_no"] = pd.to_numeric(df["county_no"], errors="coerce").astype("Int64")
-    for c in ("latitude","longitude"):
-        if c in df: df[c] = pd.to_numeric(df[c], errors="coerce")
-    for c in ("incident_id","message","message_type","location_descriptor","road_number","county_name","status"):
-        if c in df: df[c] = df[c].astype("string").str.strip()
-    for c in ("start_time_utc","end_time_utc","modified_time_utc"):
-        if c in df: df[c] = pd.to_datetime(df[c], errors="coerce", utc=True)
-
-    # county_display fallback via county_no
-    if "county_name" in df and "county_no" in df:
-        df["county_name"] = df["county_name"].where(df["county_name"].str.len() > 0, pd.NA)
-        mapped = df["county_no"].map(lambda x: COUNTY_NAMES.get(int(x)) if pd.notna(x) else None)
-        df["county_display"] = df["county_name"].fillna(mapped).fillna("Okänt län").astype("string")
-    else:
-        df["county_display"] = "Okänt län"
+    # dtypes – alla kolumner castas i ett (flertrådat) polars-pass istället för kolumn för kolumn i pandas.
+    # TRV skriver både "…Z" och "…+01:00"; normalisera Z så att ett och samma format räcker.
+    text_cols = ["incident_id","message_type","location_descriptor","road_number","status","county_display"]
+    time_cols = ["start_time_utc","modified_time_utc"]
+    pl_df = pl_df.with_columns(
+        pl.col(text_cols).cast(pl.String).str.strip_chars(),
+        pl.col(time_cols).cast(pl.String).str.replace(r"Z$", "+00:00")
+          .str.to_datetime("%Y-%m-%dT%H:%M:%S%.f%:z", time_zone="UTC", strict=False),
+    ).with_columns(
+        # UTC-dygn för trenden och färdiga tooltip-strängar för kartan – en gång i cachen i stället för per rerun
+        pl.col("start_time_utc").dt.truncate("1d").alias("start_date"),
+        pl.col("start_time_utc").dt.strftime("%Y-%m-%d %H:%M:%S UTC").fill_null("").alias("start_str"),
+        pl.col("modified_time_utc").dt.strftime("%Y-%m-%d %H:%M:%S UTC").fill_null("").alias("mod_str"),
+    )
+    df = pl_df.to_pandas(use_pyarrow_extension_array=True)
+    # Få unika värden (≤ 21 län, 2 statusar, en handfull typer, några hundra vägnummer) – category
+    # gör ==/isin/value_counts till jämförelser på heltalskoder.
+    for c in ("county_display", "status", "message_type", "road_number"):
+        df[c] = df[c].astype("category")
     return df
 
+@st.cache_data(ttl=DB_CACHE_TTL)
+def load_county_status_counts(db_version: tuple, filter_key: tuple) -> pd.DataFrame:
+    """Antal per (län, status) för sidopanelens filter – GROUP BY i SQLite, några tiotal rader.
+    Underlag för KPI:erna och stapeldiagrammet utan att räkna på hela urvalet i pandas."""
+    try:
+        con = _db_connect(db_version)
+        where, params = _filter_where(con, *filter_key)
+        rows = con.execute(
+            f"""
+            SELECT {COUNTY_DISPLAY_SQL} AS county_display, TRIM(status) AS status, COUNT(*) AS n
+            FROM incidents
+            WHERE {" AND ".join(where)}
+            GROUP BY 1, 2
+            """,
+            params,
+        ).fetchall()
+    except Exception:
+        return pd.DataFrame(columns=["county_display", "status", "n"])  # load_data visar varningen
+    return pd.DataFrame(rows, columns=["county_display", "status", "n"])
+
+# Tabellens sorteringskolumner → SQL-uttryck (vitlista). Tiderna har blandade offsets, så de sorteras
+# på julianday() för korrekt UTC-ordning; NULLS LAST som i pandas sort_values.
+TABLE_SORT_SQL = {
+    "modified_time_utc": "julianday(modified_time_utc)",
+    "start_time_utc": "julianday(start_time_utc)",
+    "county_display": "county_display",
+    "message_type": "TRIM(message_type)",
+    "road_number": "TRIM(road_number)",
+}
+
+@st.cache_data(ttl=DB_CACHE_TTL)
+def load_table(db_version: tuple, filter_key: tuple, clicked: tuple, sort_col: str, sort_desc: bool, max_rows: int) -> pd.DataFrame:
+    """Tabellens topp-max_rows direkt ur SQLite: samma filter som load_data (+ klickade län),
+    ORDER BY på vitlistad kolumn och LIMIT – SQLite håller bara topp-K i sorteringen.
+    Returneras visningsklar (tider som UTC-strängar)."""
+    order = TABLE_SORT_SQL.get(sort_col, TABLE_SORT_SQL["modified_time_utc"])
+    try:
+        con = _db_connect(db_version)
+        where, params = _filter_where(con, *filter_key)
+        if clicked:
+            where.append(f"{COUNTY_DISPLAY_SQL} IN ({','.join('?' * len(clicked))})")
+            params += list(clicked)
+        # Samma Arrow-väg som load_data: strängkolumnerna blir string[pyarrow] och st.dataframe
+        # (som serialiserar via Arrow) slipper konvertera object-kolumner vid varje rerun.
+        pl_df = pl.read_database(
+            f"""
+            SELECT TRIM(incident_id) AS incident_id, TRIM(message_type) AS message_type,
+                   TRIM(status) AS status, county_display,
+                   TRIM(road_number) AS road_number, TRIM(location_descriptor) AS location_descriptor,
+                   start_time_utc, end_time_utc, modified_time_utc, latitude, longitude
+            FROM (SELECT *, {COUNTY_DISPLAY_SQL} AS county_display FROM incidents WHERE {" AND ".join(where)})
+            ORDER BY {order} {"DESC" if sort_desc else "ASC"} NULLS LAST
+            LIMIT ?
+            """,
+            con,
+            execute_options={"parameters": params + [int(max_rows)]},
+            schema_overrides={"latitude": pl.Float64, "longitude": pl.Float64},
+        )
+    except Exception:
+        return pd.DataFrame()  # load_data visar varningen
+    # Visningssträngar för tiderna i samma cachade pass – reruns som inte rör filter/sortering
+    # återanvänder den färdiga tabellen i stället för att tolka och formatera om tre kolumner.
+    time_cols = ["start_time_utc","end_time_utc","modified_time_utc"]
+    pl_df = pl_df.with_columns(
+        pl.col(time_cols).cast(pl.String).str.replace(r"Z$", "+00:00")
+          .str.to_datetime("%Y-%m-%dT%H:%M:%S%.f%:z", time_zone="UTC", strict=False)
+          .dt.strftime("%Y-%m-%d %H:%M:%S UTC"),
+    )
+    return pl_df.select(TABLE_COLS).to_pandas(use_pyarrow_extension_array=True)
+
 # ---------------------- UI ----------------------
+db_version = _db_version()
+
 # språkval i sidopanel
 with st.sidebar:
     lang = st.selectbox(LANG["sv"]["lang_label"], ["sv","en"], index=0, key="lang_sel")
@@ -200,15 +419,14 @@ with st.sidebar:
     status_val = st.multiselect(t(lang, "status"),
                                 LANG[lang]["status_options"],
                                 default=LANG[lang]["status_options"])
-    df = load_data()
-    county_opts = sorted(df["county_display"].dropna().unique()) if not df.empty else []
+    county_opts, min_dt, max_dt = load_filter_options(db_version)
     county_val = st.multiselect(t(lang, "county"), county_opts, default=list(county_opts))
     q = st.text_input(t(lang, "search"), "")
     road = st.text_input(t(lang, "road"), "").strip()
     only_geo = st.checkbox(t(lang, "only_geo"), value=False)
 
-    min_dt = df["start_time_utc"].min() if not df.empty else pd.Timestamp.utcnow() - pd.Timedelta(days=7)
-    max_dt = df["start_time_utc"].max() if not df.empty else pd.Timestamp.utcnow()
+    if min_dt is None: min_dt = pd.Timestamp.utcnow() - pd.Timedelta(days=7)
+    if max_dt is None: max_dt = pd.Timestamp.utcnow()
     # ta bort tz för date_input
     if getattr(min_dt, "tzinfo", None): min_dt = min_dt.tz_convert(None)
     if getattr(max_dt, "tzinfo", None): max_dt = max_dt.tz_convert(None)
@@ -225,43 +443,27 @@ with st.sidebar:
     sort_desc = st.checkbox(t(lang, "desc"), value=True)
     max_rows = st.slider(t(lang, "max_rows"), 20, 500, 100, step=20)
 
-# Filtrering
-f = df.copy()
-if not f.empty:
-    if status_val: f = f[f["status"].isin(status_val)]
-    if county_val: f = f[f["county_display"].isin(county_val)]
-
-    start_ts = pd.to_datetime(date_from).tz_localize("UTC")
-    end_ts   = (pd.to_datetime(date_to) + pd.Timedelta(days=1)).tz_localize("UTC")
-    f = f[(f["start_time_utc"] >= start_ts) & (f["start_time_utc"] < end_ts)]
-
-    if q:
-        qlc = q.lower()
-        mask = (
-            f["message"].astype("string").str.lower().str.contains(qlc, na=False) |
-            f["location_descriptor"].astype("string").str.lower().str.contains(qlc, na=False) |
-            f["road_number"].astype("string").str.lower().str.contains(qlc, na=False)
-        )
-        f = f[mask]
-
-    if road:
-        f = f[f["road_number"].astype("string").str.contains(road, case=False, na=False)]
-
-    if only_geo:
-        f = f.dropna(subset=["latitude","longitude"])
+# Filtrering sker i SQL (load_data); tuples så att cache-nyckeln blir hashbar
+filter_key = (tuple(status_val), tuple(county_val), date_from, date_to, q, road, only_geo)
+f = load_data(db_version, *filter_key)
 
 # KPI
 c1, c2, c3 = st.columns(3)
-c1.metric(t(lang, "kpi_ongoing"), int((f["status"]=="PÅGÅR").sum()) if not f.empty else 0)
-c2.metric(t(lang, "kpi_upcoming"), int((f["status"]=="KOMMANDE").sum()) if not f.empty else 0)
-c3.metric(t(lang, "kpi_total"), 0 if f.empty else len(f))
+cs_counts = load_county_status_counts(db_version, filter_key)
+status_counts = cs_counts.groupby("status")["n"].sum()
+c1.metric(t(lang, "kpi_ongoing"), int(status_counts.get("PÅGÅR", 0)))
+c2.metric(t(lang, "kpi_upcoming"), int(status_counts.get("KOMMANDE", 0)))
+c3.metric(t(lang, "kpi_total"), int(status_counts.sum()))
 
 # ---------------------- Staplar ----------------------
 st.subheader(t(lang, "bar_hdr"))
 
 COLOR_MAP_PATH = "county_colors.json"
 
-def load_color_map(path=COLOR_MAP_PATH):
+@st.cache_resource(max_entries=4)
+def load_color_map(path=COLOR_MAP_PATH, mtime=None):
+    """Läses från disk en gång per filversion (mtime ingår i nyckeln, så en handredigerad fil slår
+    igenom utan omstart); dicten delas mellan sessioner och uppdateras på plats."""
     if os.path.exists(path):
         try:
             with open(path, "r", encoding="utf-8") as fjson:
@@ -271,111 +473,209 @@ def load_color_map(path=COLOR_MAP_PATH):
     return {}
 
 def save_color_map(color_map, path=COLOR_MAP_PATH):
+    """Skriv till temporärfil och byt in den med os.replace – en samtidig läsare (annan process/
+    omstart) ser antingen den gamla eller den nya filen, aldrig halvskriven JSON."""
+    tmp = f"{path}.{os.getpid()}.tmp"
     try:
-        with open(path, "w", encoding="utf-8") as fjson:
+        with open(tmp, "w", encoding="utf-8") as fjson:
             json.dump(color_map, fjson, ensure_ascii=False, indent=2)
+        os.replace(tmp, path)
     except Exception:
-        pass
-
-def short_label(s, n=24):
-    s = str(s)
-    return (s[:n] + "…") if len(s) > n else s
-
-f_base = f.copy()
-if not f_base.empty:
-    f_base["county_display"] = f_base["county_display"].astype("string").str.strip().fillna("Okänt län")
-    g = (f_base.groupby("county_display", as_index=False).size()
-         .rename(columns={"size":"count", "county_display":"county"}))
-    g["count"] = pd.to_numeric(g["count"], errors="coerce").fillna(0).astype("int64")
-else:
-    g = pd.DataFrame(columns=["county","count"])
-
-if g.empty or g["count"].sum() == 0:
-    st.info(t(lang, "bar_none"))
-else:
-    show_all = st.toggle(t(lang, "bar_all"), value=False)
-    g_sorted = g.sort_values("count", ascending=False).reset_index(drop=True)
-    plot_df = (g_sorted if show_all else g_sorted.head(10)).copy()
-
-    if "county_colors" not in st.session_state:
-        st.session_state.county_colors = load_color_map()
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
 
-    palette_full = (
+@st.cache_resource
+def get_palette() -> list:
+    return (
         px.colors.qualitative.Alphabet
         + px.colors.qualitative.Plotly
         + px.colors.qualitative.Set3
         + px.colors.qualitative.Safe
     )
-    color_cycle = cycle(palette_full)
-    updated = False
-    for lbl in g_sorted["county"]:
-        if lbl not in st.session_state.county_colors:
-            st.session_state.county_colors[lbl] = next(color_cycle)
-            updated = True
-    if updated:
-        save_color_map(st.session_state.county_colors)
-
-    plot_df = plot_df.sort_values("count", ascending=True)
-    labels_full = plot_df["county"].tolist()
-    labels_disp = [short_label(x) for x in labels_full]
-    values = plot_df["count"].astype(int).tolist()
-    bar_colors = [st.session_state.county_colors[lbl] for lbl in labels_full]
 
+def hex_to_rgba(h, a=210):
+    h = str(h).lstrip("#")
+    if len(h) != 6: return [230, 57, 70, a]
+    return [int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16), a]
+
+def short_label(s, n=24):
+    s = str(s)
+    return (s[:n] + "…") if len(s) > n else s
+
+def county_counts(cs: pd.DataFrame) -> pd.Series:
+    """Antal per län, fallande (lika antal i bokstavsordning), ur load_county_status_counts."""
+    if cs.empty:
+        return pd.Series(dtype="int64")
+    counts = cs.groupby("county_display")["n"].sum()
+    return counts.sort_index().sort_values(ascending=False, kind="stable")
+
+@st.cache_resource(max_entries=32)
+def _build_bar_fig(labels_full: tuple, labels_disp: tuple, values: tuple, bar_colors: tuple,
+                   title: str, count_label: str) -> go.Figure:
+    """Stapeldiagrammet, cachat på (etiketter, antal, färger, texter) – reruns där topplistan inte
+    ändrats återanvänder figuren utan ny Plotly-konstruktion/validering. Muteras inte efteråt."""
     fig = go.Figure(
         data=[go.Bar(
-            y=labels_disp, x=values, orientation="h",
-            text=values, textposition="outside",
-            marker=dict(color=bar_colors),
-            customdata=labels_full,
-            hovertemplate="<b>%{customdata}</b><br>"
-                          + (t(lang,"types_count") if lang=="en" else "Antal händelser")
-                          + ": %{x}<extra></extra>",
+            y=list(labels_disp), x=list(values), orientation="h",
+            text=list(values), textposition="outside",
+            marker=dict(color=list(bar_colors)),
+            customdata=list(labels_full),
+            hovertemplate="<b>%{customdata}</b><br>" + count_label + ": %{x}<extra></extra>",
         )]
     )
     max_count = max(values) if values else 1
     fig.update_layout(
-        title=(t(lang,"bar_title_all") if show_all else t(lang,"bar_title_top")),
-        yaxis=dict(type="category", categoryorder="array", categoryarray=labels_disp, title=""),
-        xaxis=dict(type="linear", rangemode="tozero",
-                   title=(t(lang,"types_count") if lang=="en" else "Antal händelser"),
+        title=title,
+        yaxis=dict(type="category", categoryorder="array", categoryarray=list(labels_disp), title=""),
+        xaxis=dict(type="linear", rangemode="tozero", title=count_label,
                    range=[0, max(1, int(max_count * 1.15))]),
         showlegend=False, bargap=0.2, margin=dict(l=110, r=40, t=50, b=40), height=540,
         plot_bgcolor="rgba(0,0,0,0)", paper_bgcolor="rgba(0,0,0,0)", font=dict(size=14),
     )
+    return fig
 
-    if "clicked_counties" not in st.session_state:
-        st.session_state.clicked_counties = set()
+counts = county_counts(cs_counts)
 
-    clicked = plotly_events(fig, click_event=True, hover_event=False, select_event=False, override_height=560)
-    if clicked:
-        pt = clicked[0]
-        clicked_short = pt.get("y")
-        name = None
-        if clicked_short in labels_disp:
-            idx = labels_disp.index(clicked_short); name = labels_full[idx]
-        else:
-            name = pt.get("label") or pt.get("x") or pt.get("y")
-        if name:
-            last = st.session_state.get("_last_clicked")
-            if last != name:
-                if name in st.session_state.clicked_counties:
-                    st.session_state.clicked_counties.remove(name)
-                else:
-                    st.session_state.clicked_counties.add(name)
-            st.session_state["_last_clicked"] = name
+if counts.empty:
+    st.info(t(lang, "bar_none"))
+else:
+    show_all = st.toggle(t(lang, "bar_all"), value=False)
 
+    try:
+        cmap_mtime = os.stat(COLOR_MAP_PATH).st_mtime_ns
+    except OSError:
+        cmap_mtime = None
+    st.session_state.county_colors = load_color_map(COLOR_MAP_PATH, cmap_mtime)  # cachad – bara ett stat-anrop per rerun
+
+    # Bara län som saknar färg går genom paletten (counts.index är redan unik)
+    known = st.session_state.county_colors.keys()
+    missing = [lbl for lbl in counts.index.tolist() if lbl not in known]
+    if missing:
+        st.session_state.county_colors.update(zip(missing, islice(cycle(get_palette()), len(missing))))
+    # JSON-skrivning och RGBA per län bara när mängden län med färg (här eller i en annan session som
+    # delar dicten) eller filen ändrats – kartan slår upp arrayen i stället för att tolka hex per rad.
+    counties_hash = hash((cmap_mtime, tuple(sorted(st.session_state.county_colors))))
+    if st.session_state.get("_counties_hash") != counties_hash:
+        if missing:
+            save_color_map(st.session_state.county_colors)
+        st.session_state["_counties_hash"] = counties_hash
+        st.session_state.county_rgba = {k: np.array(hex_to_rgba(v, 210), dtype=np.uint8)
+                                        for k, v in st.session_state.county_colors.items()}
+
+    # value_counts är redan fallande – vänd för stigande ordning i det liggande diagrammet
+    top = counts if show_all else counts.iloc[:10]
+    labels_full = top.index.to_numpy(dtype=object)[::-1].tolist()
+    labels_disp = [short_label(x) for x in labels_full]
+    values = top.to_numpy(dtype="int64")[::-1].tolist()
+    bar_colors = [st.session_state.county_colors[lbl] for lbl in labels_full]
+
+    fig = _build_bar_fig(
+        tuple(labels_full), tuple(labels_disp), tuple(values), tuple(bar_colors),
+        t(lang,"bar_title_all") if show_all else t(lang,"bar_title_top"),
+        t(lang,"types_count") if lang=="en" else "Antal händelser",
+    )
+    st.plotly_chart(fig, use_container_width=True, config={"displayModeBar": False})
+
+    # Länsfilter som multiselect under diagrammet i stället för klick-events (ingen extra
+    # JS-brygga och en rerun per val). Val som inte längre finns i urvalet rensas bort först.
+    county_opts_bar = sorted(counts.index.tolist())
+    st.session_state["county_pick"] = [c for c in st.session_state.get("county_pick", []) if c in county_opts_bar]
     c1_, c2_ = st.columns([3, 1])
     with c1_:
-        if st.session_state.clicked_counties:
-            st.info(t(lang,"bar_click_filter") + ", ".join(sorted(st.session_state.clicked_counties)))
+        picked = st.multiselect(t(lang,"bar_click_filter"), county_opts_bar, key="county_pick")
     with c2_:
-        if st.button(t(lang,"bar_clear")):
-            st.session_state.clicked_counties = set()
+        st.button(t(lang,"bar_clear"), on_click=lambda: st.session_state.update(county_pick=[]))
+    st.session_state.clicked_counties = set(picked)
 
     if st.session_state.clicked_counties:
         f = f[f["county_display"].isin(st.session_state.clicked_counties)]
 
 # ---------------------- Karta ----------------------
+MAP_QUANTIZE_MIN_ROWS = 10_000  # över detta skickas lat/lon som int32-mikrograder
+MICRODEG = 1_000_000
+MAP_DEFAULT_RGBA = (230, 57, 70, 210)
+MAP_HTML_MIN_POINTS = 3_000     # över detta renderas kartan som fristående HTML (_html_iframe)
+HEX_MIN_POINTS = 5_000          # över detta ersätts punktlagret av GPU-aggregerade hexagoner
+HEAT_BIN_MIN_POINTS = 5_000     # över detta binnas heatmap-punkterna i ett rutnät
+HEAT_BIN_DEG = 0.01             # rutnätets steg (~1 km) – i mikrograder för kvantiserade kolumner
+
+def _html_iframe(html: str, height: int) -> None:
+    """Rå HTML i en iframe: st.iframe där den finns (components.v1.html är utfasad och tas bort),
+    annars components.html för äldre Streamlit – versionen är inte pinnad i requirements.txt."""
+    if hasattr(st, "iframe"):
+        st.iframe(html, height=height)
+    else:
+        import streamlit.components.v1 as components
+        components.html(html, height=height)
+
+def _data_url(df: pd.DataFrame) -> str:
+    # double_precision=6 (~11 cm) – annars skriver encodern ut float32-brus som extra siffror.
+    payload = df.to_json(orient="records", force_ascii=False, double_precision=6)
+    return "data:application/json;base64," + base64.b64encode(payload.encode("utf-8")).decode("ascii")
+
+@st.cache_resource(max_entries=16)
+def build_deck(data_key, _map_df, layer_cols, position, fill_color, modes, map_mode, map_style,
+               point_radius, heat_intensity, hex_radius, view, tooltip_html) -> pdk.Deck:
+    """Bygger lager + Deck. Cachas på widget-värden och data_key (fingerprint av urvalet), så att
+    reruns som inte ändrar kartan återanvänder samma Deck utan ny to_dict()/Layer-konstruktion."""
+    # I stället för to_dict(orient="records") (en Python-dict per rad) serialiseras varje lager en
+    # gång med pandas JSON-encoder och skickas som data-URL – deck.gl laddar strängdata som URL själv.
+    # layer_cols börjar med (lon, lat); punktlagret tar även färg- och tooltipkolumnerna.
+    layers = []
+    if map_mode in (modes[0], modes[2]) and hex_radius:
+        # Många punkter: deck.gl aggregerar i hexagoner på GPU:n – bara positioner behövs
+        # (inga tooltips, pickable=False), så frame-tiden blir oberoende av antalet punkter.
+        layers.append(pdk.Layer(
+            "HexagonLayer", data=_data_url(_map_df[list(layer_cols[:2])]),
+            get_position=position,
+            radius=hex_radius, elevation_scale=50, extruded=False,
+            pickable=False,
+        ))
+    elif map_mode in (modes[0], modes[2]):
+        layers.append(pdk.Layer(
+            "ScatterplotLayer", data=_data_url(_map_df[list(layer_cols)]),
+            get_position=position,
+            get_fill_color=fill_color,
+            get_line_color="[0,0,0,80]",
+            line_width_min_pixels=0.5,
+            radius_min_pixels=point_radius,
+            radius_max_pixels=point_radius + 8,
+            pickable=True, auto_highlight=True,
+        ))
+    if map_mode in (modes[1], modes[2]):
+        # Många punkter: snäpp till ett ~1 km-rutnät och skicka en punkt per ruta med antalet som
+        # vikt – SUM-aggregeringen ger samma täthet, payloaden blir O(rutor) i stället för O(rader).
+        # Punktlagret förblir komplett.
+        pos_cols = list(layer_cols[:2])
+        heat_df = _map_df[pos_cols]
+        if len(heat_df) > HEAT_BIN_MIN_POINTS:
+            if pd.api.types.is_integer_dtype(heat_df[pos_cols[0]]):
+                step = int(HEAT_BIN_DEG * MICRODEG)
+                snapped = {c: (heat_df[c].to_numpy() + step // 2) // step * step for c in pos_cols}
+            else:
+                snapped = {c: np.round(heat_df[c].to_numpy(dtype="float64") / HEAT_BIN_DEG) * HEAT_BIN_DEG
+                           for c in pos_cols}
+            heat_df = pd.DataFrame(snapped).groupby(pos_cols, as_index=False, sort=False).size() \
+                                           .rename(columns={"size": "weight"})
+        else:
+            heat_df = heat_df.assign(weight=1)
+        layers.append(pdk.Layer(
+            "HeatmapLayer", data=_data_url(heat_df),
+            get_position=position, get_weight="weight",
+            aggregation='"SUM"', intensity=heat_intensity, opacity=0.58, threshold=0.01,
+        ))
+
+    lat_center, lon_center, zoom = view
+    return pdk.Deck(
+        layers=layers,
+        initial_view_state=pdk.ViewState(latitude=lat_center, longitude=lon_center, zoom=zoom),
+        map_style={"light":"light","dark":"dark","road":"road","satellite":"satellite"}.get(map_style, "light"),
+        tooltip={"html": tooltip_html,
+                 "style": {"backgroundColor":"rgba(30,30,30,0.85)","color":"white","fontSize":"12px"}},
+    )
+
 st.subheader(t(lang, "map_hdr"))
 
 colA, colB, colC = st.columns([1.3, 1, 1])
@@ -390,39 +690,62 @@ with colC:
 use_county_colors = st.session_state.get("use_county_colors", False)
 
 approx_missing = st.checkbox(t(lang,"approx_missing"), value=True)
+fast_map = st.toggle(t(lang,"map_fast"), value=True)
 
-m = f.copy()
+m = f.copy(deep=False)  # f kan vara load_data:s cachade objekt – skriv bara i en grund kopia
 if approx_missing and not m.empty:
-    m["latitude"]  = m.apply(lambda r: r["latitude"]  if pd.notna(r["latitude"])
-                             else COUNTY_CENTER.get(r["county_display"], (None, None))[0], axis=1)
-    m["longitude"] = m.apply(lambda r: r["longitude"] if pd.notna(r["longitude"])
-                             else COUNTY_CENTER.get(r["county_display"], (None, None))[1], axis=1)
-map_df = m.dropna(subset=["latitude", "longitude"]).copy()
+    m["latitude"]  = m["latitude"].fillna(m["county_display"].map(LAT_BY_COUNTY))
+    m["longitude"] = m["longitude"].fillna(m["county_display"].map(LON_BY_COUNTY))
+map_df = m.dropna(subset=["latitude", "longitude"])
 
 if map_df.empty:
     st.info(t(lang,"map_no_geo"))
 else:
     for c in ("county_display","road_number","location_descriptor","status"):
-        map_df[c] = map_df[c].astype("string").fillna("")
-    map_df["start_str"] = pd.to_datetime(map_df["start_time_utc"], utc=True, errors="coerce").astype("string").fillna("")
-    map_df["mod_str"]   = pd.to_datetime(map_df["modified_time_utc"], utc=True, errors="coerce").astype("string").fillna("")
-
-    def hex_to_rgba(h, a=210):
-        h = str(h).lstrip("#")
-        if len(h) != 6: return [230, 57, 70, a]
-        return [int(h[0:2], 16), int(h[2:4], 16), int(h[4:6], 16), a]
-
-    if use_county_colors and "county_colors" in st.session_state:
-        map_df["__color_rgba__"] = map_df["county_display"].map(st.session_state.county_colors).apply(lambda c: hex_to_rgba(c, 210))
+        s_ = map_df[c]
+        if isinstance(s_.dtype, pd.CategoricalDtype) and s_.isna().any():
+            s_ = s_.cat.add_categories([""])
+        map_df[c] = s_.fillna("")
+
+    # Länsfärger: RGBA som en (N, 4) uint8-array; kolumnen håller radvyer i samma buffert i stället
+    # för N boxade Python-listor med int. Utan länsfärger är färgen en konstant accessor och
+    # kolumnen skickas inte alls.
+    color_cols = ()
+    fill_color = str(list(MAP_DEFAULT_RGBA))
+    if use_county_colors and "county_rgba" in st.session_state:
+        # county_display är category: (K, 4)-tabell med en rad per län, sedan en NumPy-gather på koderna.
+        # Län utan tilldelad färg får standardfärgen i stället för KeyError.
+        cd = map_df["county_display"].cat
+        lut = np.tile(np.array(MAP_DEFAULT_RGBA, dtype=np.uint8), (len(cd.categories), 1))
+        for i, c in enumerate(cd.categories):
+            if c in st.session_state.county_rgba:
+                lut[i] = st.session_state.county_rgba[c]
+        map_df["__color_rgba__"] = list(lut[cd.codes.to_numpy()])
+        color_cols, fill_color = ("__color_rgba__",), "__color_rgba__"
+
+    # Stora urval: koordinater som int32-mikrograder (1e-6° ≈ 11 cm) – halva antalet bytes till pydeck
+    # och min/max för auto-zoom på int32. Små urval skickas som float32.
+    quantize = len(map_df) > MAP_QUANTIZE_MIN_ROWS
+    if quantize:
+        map_df["lat_u"] = (map_df["latitude"] * MICRODEG).round().astype("int32")
+        map_df["lon_u"] = (map_df["longitude"] * MICRODEG).round().astype("int32")
+        lat_col, lon_col, scale = "lat_u", "lon_u", MICRODEG
+        position = f"[lon_u / {MICRODEG}, lat_u / {MICRODEG}]"
     else:
-        map_df["__color_rgba__"] = [[230, 57, 70, 210]] * len(map_df)
+        # float32 räcker för kartan (~1 m) och halverar koordinatkolumnerna
+        map_df["latitude"]  = map_df["latitude"].astype("float32")
+        map_df["longitude"] = map_df["longitude"].astype("float32")
+        lat_col, lon_col, scale = "latitude", "longitude", 1
+        position = "[longitude, latitude]"
 
     selected = set(st.session_state.get("clicked_counties", []))
     focus_df = map_df[map_df["county_display"].isin(selected)] if selected else map_df
     if focus_df.empty: focus_df = map_df
 
-    lat_min, lat_max = float(focus_df["latitude"].min()), float(focus_df["latitude"].max())
-    lon_min, lon_max = float(focus_df["longitude"].min()), float(focus_df["longitude"].max())
+    # en min/max-svepning över (n, 2)-arrayen i stället för fyra pandas-reduktioner
+    pos = focus_df[[lat_col, lon_col]].to_numpy()
+    (lat_min, lon_min), (lat_max, lon_max) = pos.min(axis=0) / scale, pos.max(axis=0) / scale
+    lat_min, lon_min, lat_max, lon_max = map(float, (lat_min, lon_min, lat_max, lon_max))
     lat_center = (lat_min + lat_max) / 2.0
     lon_center = (lon_min + lon_max) / 2.0
     span = max(lat_max - lat_min, lon_max - lon_min)
@@ -433,47 +756,33 @@ else:
         point_radius = st.slider(t(lang,"map_point_size"), 2, 20, 8)
     with c2x:
         heat_intensity = st.slider(t(lang,"map_heat_intensity"), 1, 20, 8)
-
-    data_records = map_df.to_dict(orient="records")
-    layers = []
-    modes = LANG[lang]["map_modes"]
-    if map_mode in (modes[0], modes[2]):
-        layers.append(pdk.Layer(
-            "ScatterplotLayer", data=data_records,
-            get_position="[longitude, latitude]",
-            get_fill_color="__color_rgba__",
-            get_line_color="[0,0,0,80]",
-            line_width_min_pixels=0.5,
-            radius_min_pixels=point_radius,
-            radius_max_pixels=point_radius + 8,
-            pickable=True, auto_highlight=True,
-        ))
-    if map_mode in (modes[1], modes[2]):
-        layers.append(pdk.Layer(
-            "HeatmapLayer", data=data_records,
-            get_position="[longitude, latitude]",
-            aggregation='"SUM"', intensity=heat_intensity, opacity=0.58, threshold=0.01,
-        ))
-
-    deck = pdk.Deck(
-        layers=layers,
-        initial_view_state=pdk.ViewState(latitude=lat_center, longitude=lon_center, zoom=zoom),
-        map_style={"light":"light","dark":"dark","road":"road","satellite":"satellite"}.get(map_style, "light"),
-        tooltip={"html": t(lang,"map_tooltip"),
-                 "style": {"backgroundColor":"rgba(30,30,30,0.85)","color":"white","fontSize":"12px"}},
+    hex_radius = None
+    if len(map_df) > HEX_MIN_POINTS and map_mode in (LANG[lang]["map_modes"][0], LANG[lang]["map_modes"][2]):
+        with st.sidebar:
+            hex_radius = st.slider(t(lang,"map_hex_radius"), 500, 10_000, 2_000, step=500)
+
+    layer_cols = (lon_col, lat_col, *color_cols, "county_display", "road_number",
+                  "location_descriptor", "status", "start_str", "mod_str")
+    colors_key = tuple(sorted(st.session_state.county_colors.items())) \
+        if use_county_colors and "county_colors" in st.session_state else None
+    data_key = (len(map_df), int(pd.util.hash_pandas_object(map_df[["incident_id", "modified_time_utc"]], index=False).sum()), colors_key)
+    deck = build_deck(
+        data_key, map_df, layer_cols, position, fill_color, tuple(LANG[lang]["map_modes"]), map_mode, map_style,
+        point_radius, heat_intensity, hex_radius, (lat_center, lon_center, zoom), t(lang,"map_tooltip"),
     )
-    st.pydeck_chart(deck)  # OBS: pydeck har ingen width-parameter ännu
+    if fast_map and len(map_df) > MAP_HTML_MIN_POINTS:
+        # Stora urval: fristående deck.gl-sida i en iframe i stället för Streamlits pydeck-komponent
+        # (som marshallar om hela specen vid interaktion). Zoom-/fullskärmsknapparna faller bort;
+        # stäng av reglaget för att få tillbaka st.pydeck_chart.
+        _html_iframe(deck.to_html(as_string=True, iframe_height=640), height=640)
+    else:
+        st.pydeck_chart(deck)  # OBS: pydeck har ingen width-parameter ännu
 
 # ---------------------- Tabell ----------------------
 st.subheader(t(lang, "table_hdr", n=max_rows))
-f_sorted = f.sort_values(by=sort_col, ascending=not sort_desc).head(max_rows) if not f.empty else f
-if not f_sorted.empty:
-    show_cols = ["incident_id","message_type","status","county_display",
-                 "road_number","location_descriptor",
-                 "start_time_utc","end_time_utc","modified_time_utc","latitude","longitude"]
-    table = f_sorted[show_cols].copy()
-    for c in ("start_time_utc","end_time_utc","modified_time_utc"):
-        table[c] = pd.to_datetime(table[c], utc=True, errors="coerce").dt.strftime("%Y-%m-%d %H:%M:%S UTC")
+table = load_table(db_version, filter_key, tuple(sorted(st.session_state.get("clicked_counties", set()))),
+                   sort_col, sort_desc, max_rows) if not f.empty else pd.DataFrame()
+if not table.empty:
     st.dataframe(table.rename(columns={"county_display": "county"}), use_container_width=True)
 else:
     st.info(t(lang, "no_rows_for_table"))
@@ -481,8 +790,8 @@ else:
 # ---------------------- Trend ----------------------
 st.subheader(t(lang, "trend_hdr"))
 if not f.empty:
-    trend = (f.assign(date=pd.to_datetime(f["start_time_utc"], utc=True).dt.date)
-               .groupby("date").size().reset_index(name="count"))
+    # start_date (UTC-dygn) räknas i load_data – datetime-typ, ingen boxning till datetime.date
+    trend = f["start_date"].value_counts().sort_index().rename_axis("date").reset_index(name="count")
     fig_trend = px.line(
         trend, x="date", y="count", markers=True,
         labels={"date": t(lang,"trend_date"), "count": t(lang,"trend_count")},
@@ -495,7 +804,7 @@ else:
 # ---------------------- Typer ----------------------
 st.subheader(t(lang, "types_hdr"))
 if not f.empty and "message_type" in f.columns:
-    type_counts = f["message_type"].value_counts().reset_index()
+    type_counts = f["message_type"].value_counts().loc[lambda s: s > 0].reset_index()  # category: dölj tomma
     type_counts.columns = [t(lang,"types_type"), t(lang,"types_count")]
     fig_types = px.bar(
         type_counts, x=t(lang,"types_count"), y=t(lang,"types_type"),
@@ -3,13 +3,15 @@ import click
 import datetime as dt
 import os
 import time
+from concurrent.futures import ThreadPoolExecutor
 
 from src.logger import setup_logger                    # Logger-funktion för att skriva loggar
-from src.trv.config import TRV_API_KEY, TRV_BASE_URL, DEFAULT_DAYS_BACK  # Konfig och API-nycklar
-from src.trv.client import TRVClient                   # Klientklass för att prata med TRV:s API
-from src.trv.endpoints import iterate_incidents        # Funktion för att hämta incidenter (med pagination)
+from src.trv import config                             # Konfig och API-nycklar (hemligheter läses vid första åtkomst)
+from src.trv.config import DEFAULT_DAYS_BACK
+from src.trv.client import TRVClient, TRVClientHTTP2   # Klientklasser för att prata med TRV:s API
+from src.trv.endpoints import iterate_situation_pages  # Funktion för att hämta Situation-objekt sida för sida (pagination)
 from src.trv.transform import normalize_incidents      # Funktion som normaliserar API-data → DataFrame
-from src.trv.load_sqlite import ensure_schema, upsert_incidents  # Skapar schema + laddar data till SQLite
+from src.trv.load_sqlite import ensure_schema, upsert_incidents, analyze_incidents  # Schema + laddning till SQLite
 from src.utils.notifier import notify                  # Funktion för Slack-notiser
 
 # ------------------------------------------------------------
@@ -19,6 +21,27 @@ from src.utils.notifier import notify                  # Funktion för Slack-not
 # ------------------------------------------------------------
 EXPECT_MIN_ROWS = int(os.getenv("EXPECT_MIN_ROWS", "0") or 0)
 EXPECT_MAX_ROWS = int(os.getenv("EXPECT_MAX_ROWS", "0") or 0)
+# TRV_HTTP2=1: hämta via HTTP/2-klienten (kräver httpx[http2]) i stället för requests
+USE_HTTP2 = os.getenv("TRV_HTTP2", "") == "1"
+
+
+# ------------------------------------------------------------
+# Förhämtning: nästa sida hämtas i en bakgrundstråd medan den aktuella
+# normaliseras och upsertas. Paginationen är cursor-baserad (nästa fråga
+# bygger på sista raden i förra sidan) så sidorna kan inte hämtas parallellt –
+# men nätverksväntan överlappar med CPU/DB-arbetet.
+# ------------------------------------------------------------
+def _prefetch(iterable):
+    it = iter(iterable)
+    done = object()
+    with ThreadPoolExecutor(max_workers=1) as ex:
+        fut = ex.submit(next, it, done)
+        while True:
+            item = fut.result()
+            if item is done:
+                return
+            fut = ex.submit(next, it, done)
+            yield item
 
 
 # ------------------------------------------------------------
@@ -47,56 +70,73 @@ def extract_trv(db_path: str, days_back: int):
 
     try:
         # 2) Validera API-konfig
-        if not TRV_API_KEY:
+        if not config.TRV_API_KEY:
             raise RuntimeError("Saknar TRV_API_KEY i .env")  # Stanna om nyckel saknas
-        if not TRV_BASE_URL:
+        if not config.TRV_BASE_URL:
             raise RuntimeError("Saknar TRV_BASE_URL i .env")
 
         # 3) Initiera TRV-klient + kontrollera schema i SQLite
-        client = TRVClient(api_key=TRV_API_KEY, base_url=TRV_BASE_URL)
+        client_cls = TRVClientHTTP2 if USE_HTTP2 else TRVClient
+        client = client_cls(api_key=config.TRV_API_KEY, base_url=config.TRV_BASE_URL)
         ensure_schema(db_path)  # Skapa tabeller om de inte finns
         logger.info("Schema kontrollerat/skapats")
 
-        # 4) Extrahera data (hämtar alla incidenter sedan 'since')
-        situations = list(iterate_incidents(client, since_utc=since, page_size=500))
-        got_msg = f"📥 Hämtat {len(situations)} Situation-objekt"
+        # 4–6) Extrahera, transformera och ladda sida för sida: varje sida normaliseras och upsertas
+        # direkt, så minnet hålls på en sida i stället för hela hämtningen.
+        # (UPSERT = uppdatera befintliga + lägg till nya.) Dubbletter mellan sidor:
+        #  - samma incident-id: iterate_situation_pages behåller första – senast ändrade – förekomsten
+        #  - samma (message, location, start, end): `seen` delas mellan sidornas normalize_incidents,
+        #    så att exakta dubbletter hoppas över som när hela hämtningen normaliserades i ett anrop.
+        #    (Dubbletter som bara skiljer sig i tidsformat, "Z" mot "+00:00", fångas bara inom en sida.)
+        n_fetched = n_rows = 0
+        pagar = kommande = 0
+        seen: set = set()
+        for page in _prefetch(iterate_situation_pages(client, since_utc=since, page_size=500)):
+            n_fetched += len(page)
+            # radordningen spelar ingen roll för upserten
+            df = normalize_incidents(page, sort_for_display=False, seen=seen)
+            if df.empty:
+                continue
+            upsert_incidents(db_path, df, analyze=False)
+            n_rows += len(df)
+
+            # 7) KPI (räknar antal PÅGÅR och KOMMANDE incidenter) – summeras över sidorna
+            if "status" in df.columns:
+                c = df["status"].value_counts().to_dict()
+                pagar += c.get("PÅGÅR", 0)
+                kommande += c.get("KOMMANDE", 0)
+
+        got_msg = f"📥 Hämtat {n_fetched} Situation-objekt"
         logger.info(got_msg)
         notify(got_msg, level="info")
 
-        # 5) Transformera data (normalisera till tabellformat)
-        df = normalize_incidents(situations)
-        norm_msg = f"🧮 Normaliserat → {len(df)} rader"
+        norm_msg = f"🧮 Normaliserat → {n_rows} rader"
         logger.info(norm_msg)
         notify(norm_msg, level="info")
 
-        # 6) Ladda data till SQLite (UPSERT = uppdatera befintliga + lägg till nya)
-        upsert_incidents(db_path, df)
+        # Planerarstatistik en gång efter alla sidor i stället för per upsert
+        if n_rows:
+            analyze_incidents(db_path)
         logger.info("Data upsertad i SQLite")
 
-        # 7) Summering + KPI (räknar antal PÅGÅR och KOMMANDE incidenter)
-        pagar = kommande = 0
-        if not df.empty and "status" in df.columns:
-            c = df["status"].value_counts().to_dict()
-            pagar, kommande = c.get("PÅGÅR", 0), c.get("KOMMANDE", 0)
-
         # Beräkna körtid i sekunder
         secs = round(time.time() - t0, 1)
 
         # Skicka klart-notis
         done_msg = (
-            f"✅ ETL klar • rader=`{len(df)}` • PÅGÅR=`{pagar}` • KOMMANDE=`{kommande}` • "
+            f"✅ ETL klar • rader=`{n_rows}` • PÅGÅR=`{pagar}` • KOMMANDE=`{kommande}` • "
             f"tid=`{secs}s` • db=`{db_path}`"
         )
         logger.info(done_msg)
         notify(done_msg, level="success")
 
         # 8) Varningar om antal rader är misstänkt (0, för få eller för många)
-        if len(df) == 0:
+        if n_rows == 0:
             notify("⚠️ Varning: ETL returnerade 0 rader.", level="warning")
-        if EXPECT_MIN_ROWS and len(df) < EXPECT_MIN_ROWS:
-            notify(f"⚠️ Varning: lågt antal rader ({len(df)} < {EXPECT_MIN_ROWS}).", level="warning")
-        if EXPECT_MAX_ROWS and len(df) > EXPECT_MAX_ROWS:
-            notify(f"⚠️ Varning: högt antal rader ({len(df)} > {EXPECT_MAX_ROWS}).", level="warning")
+        if EXPECT_MIN_ROWS and n_rows < EXPECT_MIN_ROWS:
+            notify(f"⚠️ Varning: lågt antal rader ({n_rows} < {EXPECT_MIN_ROWS}).", level="warning")
+        if EXPECT_MAX_ROWS and n_rows > EXPECT_MAX_ROWS:
+            notify(f"⚠️ Varning: högt antal rader ({n_rows} > {EXPECT_MAX_ROWS}).", level="warning")
 
     except Exception as e:
         # 9) Felhantering (skicka felnotis till Slack + logga full stacktrace)
@@ -1,5 +1,5 @@
-import logging, os
-from logging.handlers import RotatingFileHandler
+import atexit, logging, os, queue
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 
 def setup_logger(name: str = "ETL", log_dir: str = "logs") -> logging.Logger:
     os.makedirs(log_dir, exist_ok=True)
@@ -8,10 +8,14 @@ def setup_logger(name: str = "ETL", log_dir: str = "logs") -> logging.Logger:
     logger = logging.getLogger(name)
     logger.setLevel(logging.INFO)
 
+    if logger.handlers:
+        return logger
+
     fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(name)s - %(message)s",
                             datefmt="%Y-%m-%d %H:%M:%S")
 
-    fh = RotatingFileHandler(log_path, maxBytes=5_000_000, backupCount=5, encoding="utf-8")
+    # delay=True: filen öppnas först vid första loggraden
+    fh = RotatingFileHandler(log_path, maxBytes=5_000_000, backupCount=5, encoding="utf-8", delay=True)
     fh.setLevel(logging.DEBUG)
     fh.setFormatter(fmt)
 
@@ -19,8 +23,11 @@ def setup_logger(name: str = "ETL", log_dir: str = "logs") -> logging.Logger:
     ch.setLevel(logging.INFO)
     ch.setFormatter(fmt)
 
-    if not logger.handlers:
-        logger.addHandler(fh)
-        logger.addHandler(ch)
+    # ETL-tråden lägger bara posten i kön; en bakgrundstråd skriver till fil/konsol (och roterar)
+    q: queue.Queue = queue.Queue(-1)
+    logger.addHandler(QueueHandler(q))
+    listener = QueueListener(q, fh, ch, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)  # töm kön innan processen avslutas
 
     return logger
@@ -1,15 +1,65 @@
 # src/trv/client.py
 from __future__ import annotations
-import time
 import logging
-from typing import Any
-import requests
 import random
+import time
+from itertools import takewhile
+from typing import Any, Iterator
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:  # optional: only needed for TRVClientHTTP2
+    import httpx
+except ImportError:
+    httpx = None
 
 log = logging.getLogger(__name__)
 
+RETRY_STATUS = (429, 500, 502, 503, 504)
+RETRY_AFTER_MAX = 60.0  # cap for a server-provided Retry-After (keeps CI runs bounded)
+
+_HEADERS = {
+    "Content-Type": "application/xml",
+    "Accept": "application/xml",
+    "User-Agent": "trafik-etl-modular/1.0 (+github actions)"
+}
+
+
+class _CappedRetry(Retry):
+    """
+    urllib3 Retry with TRVClient's own timing: full-jitter exponential backoff
+    (uniform in [0, min(backoff_factor * 2**n, BACKOFF_MAX)] after the n-th consecutive
+    failure) so concurrent workers spread out instead of retrying in lockstep, and a
+    server-provided Retry-After (capped at RETRY_AFTER_MAX) wins only when it is longer.
+    """
+
+    BACKOFF_MAX = 15.0  # cap for the computed delay (urllib3 < 2 has no backoff_max argument)
+
+    def get_backoff_time(self) -> float:
+        # Only the last run of consecutive errors counts (redirects reset it), as in urllib3
+        n = len(list(takewhile(lambda x: x.redirect_location is None, reversed(self.history))))
+        if n == 0:
+            return 0.0
+        return random.random() * min(self.backoff_factor * (2 ** n), self.BACKOFF_MAX)
+
+    def get_retry_after(self, response):
+        retry_after = super().get_retry_after(response)
+        return None if retry_after is None else min(retry_after, RETRY_AFTER_MAX)
+
+    def sleep_for_retry(self, response) -> bool:
+        retry_after = self.get_retry_after(response)
+        if retry_after is None:
+            return False  # urllib3 falls back to get_backoff_time()
+        time.sleep(max(self.get_backoff_time(), retry_after))
+        return True
+
+
 class TRVClient:
-    """HTTP client for Trafikverket that posts XML and returns raw XML text."""
+    """HTTP client for Trafikverket that posts XML and returns the raw XML response body."""
+
+    BACKOFF_BASE = 0.25   # seconds
+    BACKOFF_MAX = _CappedRetry.BACKOFF_MAX  # cap for the computed delay
 
     def __init__(self, api_key: str, base_url: str, timeout: int = 30):
         # Note: api_key is not used here; TRV expects it inside the XML <LOGIN>.
@@ -17,44 +67,151 @@ class TRVClient:
         self.base_url = base_url
         self.timeout = timeout
         self._session = requests.Session()
-        self._session.headers.update({
-            "Content-Type": "application/xml",
-            "Accept": "application/xml",
-            "User-Agent": "trafik-etl-modular/1.0 (+github actions)"
-        })
-
-    def _sleep_backoff(self, attempt: int):
-        """Exponential backoff with jitter to avoid thundering herd."""
-        base = min(2 ** attempt, 10)
-        time.sleep(base + random.random())
-
-    def post(self, payload_xml: str) -> str:
+        self._session.headers.update(_HEADERS)
+        # Pooled keep-alive connections + retries inside urllib3 (connection errors and
+        # transient statuses, with backoff and Retry-After) instead of a Python-level loop.
+        adapter = HTTPAdapter(pool_connections=32, pool_maxsize=64, max_retries=self._retry_policy())
+        self._session.mount("https://", adapter)
+        self._session.mount("http://", adapter)
+
+    @classmethod
+    def _retry_policy(cls) -> Retry:
+        """Full-jitter backoff (see _CappedRetry); POST is retried since TRV queries are read-only."""
+        return _CappedRetry(
+            total=5,
+            backoff_factor=cls.BACKOFF_BASE,
+            status_forcelist=RETRY_STATUS,
+            allowed_methods=frozenset(["POST"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,  # hand the last response back so post() can log it
+        )
+
+    STREAM_CHUNK = 64 * 1024  # bytes per chunk handed to the pull parser
+
+    def _send(self, payload_xml: str | bytes, stream: bool = False) -> requests.Response:
+        """POSTs the query and returns the 200 response; raises on any other outcome."""
+        if isinstance(payload_xml, str):
+            payload_xml = payload_xml.encode("utf-8")
+        try:
+            resp = self._session.post(self.base_url, data=payload_xml, timeout=self.timeout, stream=stream)
+        except requests.RequestException as e:
+            log.exception("Network error calling TRV: %s", e)
+            raise RuntimeError("Failed to fetch from TRV after multiple attempts.") from e
+
+        if resp.status_code == 200:
+            return resp
+
+        log.warning("TRV %s: %s", resp.status_code, resp.text[:500])
+        resp.close()
+
+        # Non-retryable HTTP errors
+        if resp.status_code not in RETRY_STATUS:
+            resp.raise_for_status()
+
+        raise RuntimeError("Failed to fetch from TRV after multiple attempts.")
+
+    def post(self, payload_xml: str | bytes) -> bytes:
         """
-        Sends the XML query to Trafikverket and returns XML as a string.
-        Retries on transient errors.
+        Sends the XML query to Trafikverket and returns the XML response as bytes.
+        The body is handed to the parser undecoded (the XML declaration carries the
+        encoding), which skips requests' charset detection and a full str copy.
+        A payload that is already utf-8 bytes (as built by endpoints) is sent as-is.
+        Transient errors are retried by the session's urllib3 Retry policy.
         """
-        url = self.base_url
-        for attempt in range(5):
-            try:
-                resp = self._session.post(
-                    url, data=payload_xml.encode("utf-8"), timeout=self.timeout
-                )
+        return self._send(payload_xml).content  # raw XML bytes
 
-                if resp.status_code == 200:
-                    return resp.text  # raw XML
+    def post_stream(self, payload_xml: str | bytes) -> Iterator[bytes]:
+        """
+        Like post(), but yields the response body in STREAM_CHUNK pieces as it arrives,
+        so the caller can parse incrementally without holding the whole body.
+        The status is checked (and retried) before the first chunk is yielded.
+        """
+        resp = self._send(payload_xml, stream=True)
+        try:
+            yield from resp.iter_content(chunk_size=self.STREAM_CHUNK)
+        except requests.RequestException as e:
+            log.exception("Network error reading TRV response: %s", e)
+            raise RuntimeError("Failed to read the TRV response.") from e
+        finally:
+            resp.close()
 
-                log.warning("TRV %s: %s", resp.status_code, resp.text[:500])
 
-                # Transient server/rate errors → retry
-                if resp.status_code in (429, 500, 502, 503, 504):
-                    self._sleep_backoff(attempt)
-                    continue
+class TRVClientHTTP2:
+    """
+    Opt-in HTTP/2 client (httpx + h2) with the same post() contract as TRVClient.
+    All requests share one multiplexed TLS connection per host. httpx has no urllib3
+    Retry, so transient statuses are retried here with the same backoff/Retry-After
+    rules; connection errors are retried by the transport.
+    """
 
-                # Non-retryable HTTP errors
-                resp.raise_for_status()
+    RETRIES = 5  # same budget as TRVClient's Retry(total=5)
+    BACKOFF_BASE = TRVClient.BACKOFF_BASE
+    BACKOFF_MAX = TRVClient.BACKOFF_MAX
+
+    def __init__(self, api_key: str, base_url: str, timeout: int = 30):
+        if httpx is None:
+            raise RuntimeError("TRVClientHTTP2 requires httpx: pip install 'httpx[http2]'")
+        self.api_key = api_key
+        self.base_url = base_url
+        self.timeout = timeout
+        limits = httpx.Limits(max_connections=8, max_keepalive_connections=8)
+        try:
+            transport = httpx.HTTPTransport(http2=True, limits=limits, retries=self.RETRIES)
+        except ImportError as e:  # http2=True needs the h2 package
+            raise RuntimeError("TRVClientHTTP2 requires h2: pip install 'httpx[http2]'") from e
+        self._client = httpx.Client(transport=transport, timeout=timeout, headers=_HEADERS)
 
-            except requests.RequestException as e:
+    def _delay(self, attempt: int, resp: Any) -> float:
+        """Same rule as _CappedRetry: full-jitter backoff, or a longer (capped) Retry-After."""
+        backoff = random.random() * min(self.BACKOFF_BASE * (2 ** attempt), self.BACKOFF_MAX)
+        retry_after = resp.headers.get("Retry-After")
+        if retry_after and retry_after.strip().isdigit():
+            return max(backoff, min(float(retry_after), RETRY_AFTER_MAX))
+        return backoff
+
+    STREAM_CHUNK = TRVClient.STREAM_CHUNK
+
+    def _send(self, payload_xml: str | bytes, stream: bool = False) -> Any:
+        """POSTs the query and returns the 200 response (unread if stream); raises otherwise."""
+        if isinstance(payload_xml, str):
+            payload_xml = payload_xml.encode("utf-8")
+        request = self._client.build_request("POST", self.base_url, content=payload_xml)
+        for attempt in range(1, self.RETRIES + 2):
+            try:
+                resp = self._client.send(request, stream=stream)
+            except httpx.HTTPError as e:
                 log.exception("Network error calling TRV: %s", e)
-                self._sleep_backoff(attempt)
+                raise RuntimeError("Failed to fetch from TRV after multiple attempts.") from e
+
+            if resp.status_code == 200:
+                return resp
+
+            resp.read()
+            resp.close()
+            log.warning("TRV %s: %s", resp.status_code, resp.text[:500])
+
+            # Non-retryable HTTP errors
+            if resp.status_code not in RETRY_STATUS:
+                resp.raise_for_status()
+            if attempt <= self.RETRIES:
+                time.sleep(self._delay(attempt, resp))
 
         raise RuntimeError("Failed to fetch from TRV after multiple attempts.")
+
+    def post(self, payload_xml: str | bytes) -> bytes:
+        """Sends the XML query and returns the XML response as bytes (see TRVClient.post)."""
+        return self._send(payload_xml).content  # raw XML bytes
+
+    def post_stream(self, payload_xml: str | bytes) -> Iterator[bytes]:
+        """Yields the response body in chunks as it arrives (see TRVClient.post_stream)."""
+        resp = self._send(payload_xml, stream=True)
+        try:
+            yield from resp.iter_bytes(chunk_size=self.STREAM_CHUNK)
+        except httpx.HTTPError as e:
+            log.exception("Network error reading TRV response: %s", e)
+            raise RuntimeError("Failed to read the TRV response.") from e
+        finally:
+            resp.close()
+
+    def close(self) -> None:
+        self._client.close()
@@ -1,24 +1,46 @@
 # src/trv/config.py
+# Värdena löses lazy (PEP 562 __getattr__) vid första åtkomst i stället för vid import:
+# .env läses först när något konfigvärde efterfrågas, och streamlit (tung import) laddas
+# bara när en hemlighet (API-nyckel, URL, webhook) faktiskt behövs.
 import os
 
-try:
-    from dotenv import load_dotenv
-    load_dotenv()
-except ImportError:
-    pass
+_SECRET_NAMES = ("TRV_API_KEY", "SLACK_WEBHOOK_URL", "TRV_BASE_URL")
+_DEFAULT_BASE_URL = "https://api.trafikinfo.trafikverket.se/v2/data.xml"
 
-try:
-    import streamlit as st
-    TRV_API_KEY = st.secrets.get("TRV_API_KEY", os.getenv("TRV_API_KEY", ""))
-    SLACK_WEBHOOK_URL = st.secrets.get("SLACK_WEBHOOK_URL", os.getenv("SLACK_WEBHOOK_URL", ""))
-    TRV_BASE_URL = st.secrets.get("TRV_BASE_URL", os.getenv("TRV_BASE_URL", "https://api.trafikinfo.trafikverket.se/v2/data.xml"))
-except ModuleNotFoundError:
-    TRV_API_KEY = os.getenv("TRV_API_KEY", "")
-    SLACK_WEBHOOK_URL = os.getenv("SLACK_WEBHOOK_URL", "")
-    TRV_BASE_URL = os.getenv("TRV_BASE_URL", "https://api.trafikinfo.trafikverket.se/v2/data.xml")
+_env_loaded = False
 
-# Default config
-DEFAULT_DAYS_BACK = int(os.getenv("DEFAULT_DAYS_BACK", "1"))
+def _load_env() -> None:
+    global _env_loaded
+    if _env_loaded:
+        return
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
+    _env_loaded = True
 
-# 🔹 Add this missing one
-DEFAULT_PAGE_SIZE = int(os.getenv("DEFAULT_PAGE_SIZE", "500"))
+def _load_secrets() -> None:
+    _load_env()
+    defaults = {"TRV_API_KEY": "", "SLACK_WEBHOOK_URL": "", "TRV_BASE_URL": _DEFAULT_BASE_URL}
+    try:
+        import streamlit as st
+        values = {k: st.secrets.get(k, os.getenv(k, d)) for k, d in defaults.items()}
+    except Exception:  # streamlit saknas eller ingen secrets.toml -> miljövariabler
+        values = {k: os.getenv(k, d) for k, d in defaults.items()}
+    globals().update(values)  # cachas: __getattr__ anropas inte igen för dessa namn
+
+def __getattr__(name: str):
+    if name in _SECRET_NAMES:
+        _load_secrets()
+        return globals()[name]
+    _load_env()
+    # Default config
+    if name == "DEFAULT_DAYS_BACK":
+        value = int(os.getenv("DEFAULT_DAYS_BACK", "1"))
+    elif name == "DEFAULT_PAGE_SIZE":
+        value = int(os.getenv("DEFAULT_PAGE_SIZE", "500"))
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
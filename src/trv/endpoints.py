@@ -1,7 +1,10 @@
 # src/trv/endpoints.py
 from __future__ import annotations
+import re
+import sys
 import datetime as dt
-from typing import Dict, Any, Iterator, Optional, List, Tuple
+from functools import lru_cache
+from typing import Callable, Dict, Any, Iterable, Iterator, Optional, List, Tuple, Union
 from xml.etree import ElementTree as ET
 
 from .config import DEFAULT_PAGE_SIZE  # behåll din egna config
@@ -13,41 +16,42 @@ def _iso_z(ts: dt.datetime) -> str:
         ts = ts.replace(tzinfo=dt.UTC)
     return ts.astimezone(dt.UTC).isoformat(timespec="seconds").replace("+00:00", "Z")
 
+# 'POINT (lon lat)' – exakt två tal inom parentesen (POINT Z/MULTIPOINT matchar inte)
+_POINT_RE = re.compile(r"POINT\s*\(\s*([-+]?\d+(?:\.\d*)?)\s+([-+]?\d+(?:\.\d*)?)\s*\)")
+
 def _wgs84_to_latlon(wgs84: str) -> Tuple[Optional[float], Optional[float]]:
     """
     Vanligt TRV-format: 'POINT (lon lat)'. Returnerar (lat, lon) som float.
     """
-    if not wgs84:
+    m = _POINT_RE.search(wgs84) if wgs84 else None
+    if m is None:
         return None, None
+    return float(m.group(2)), float(m.group(1))
+
+@lru_cache(maxsize=4096)
+def _parse_iso(s: str) -> Optional[dt.datetime]:
+    """ISO-tid → tz-medveten datetime (None vid fel). Cachad: samma Start-/EndTime-strängar
+    återkommer mellan sidor och körningar, och datetime är oföränderlig."""
+    if not s:
+        return None
     try:
-        if "POINT" in wgs84:
-            coords = wgs84[wgs84.find("(")+1:wgs84.find(")")].strip()
-            parts = coords.split()
-            if len(parts) == 2:
-                lon = float(parts[0]); lat = float(parts[1])
-                return lat, lon
+        # Hantera både ...Z och offset (fromisoformat klarar "Z" sedan 3.11 – ingen replace-kopia)
+        dtp = dt.datetime.fromisoformat(s)
+        return dtp if dtp.tzinfo else dtp.replace(tzinfo=dt.UTC)
     except Exception:
-        pass
-    return None, None
+        return None
 
-def _compute_status(start_iso: str, end_iso: str) -> str:
+def _compute_status(start_iso: str, end_iso: str, now: Optional[dt.datetime] = None) -> str:
     """
     Grov status-beräkning om API:t inte lämnar ett statusfält.
     PÅGÅR om start <= nu < end (eller end saknas), annars KOMMANDE om start > nu.
+    `now` skickas in av anroparen (en klockläsning per sida i stället för per rad).
     """
-    now = dt.datetime.now(dt.UTC)
-    def _parse(s: str) -> Optional[dt.datetime]:
-        if not s:
-            return None
-        try:
-            # Hantera både ...Z och offset
-            dtp = dt.datetime.fromisoformat(s.replace("Z", "+00:00"))
-            return dtp if dtp.tzinfo else dtp.replace(tzinfo=dt.UTC)
-        except Exception:
-            return None
+    if now is None:
+        now = dt.datetime.now(dt.UTC)
 
-    st = _parse(start_iso)
-    en = _parse(end_iso)
+    st = _parse_iso(start_iso)
+    en = _parse_iso(end_iso)
 
     if st and st > now:
         return "KOMMANDE"
@@ -57,6 +61,31 @@ def _compute_status(start_iso: str, end_iso: str) -> str:
     return "PÅGÅR" if not st else "KOMMANDE"
 
 # --------- XML-byggare (utan Deviation.* i FILTER/ORDERBY/INCLUDE) ---------
+# Statiskt skelett för Situation-frågan; bara nyckel, limit och filter varierar mellan sidor.
+_QUERY_TEMPLATE = """
+<REQUEST>
+  <LOGIN authenticationkey="{api_key}" />
+  <QUERY objecttype="Situation" schemaversion="1" limit="{limit}"
+         orderby="ModifiedTime desc, PublicationTime desc">
+    <FILTER>
+      {filters}
+    </FILTER>
+
+    <INCLUDE>Id</INCLUDE>
+    <INCLUDE>ModifiedTime</INCLUDE>
+    <INCLUDE>PublicationTime</INCLUDE>
+    <INCLUDE>Deviation</INCLUDE>
+  </QUERY>
+</REQUEST>
+""".strip()
+
+# Skelettet delas en gång vid import i färdigkodade bytes-segment runt platshållarna,
+# så att varje sida bara kodar nyckel/limit/filter och fogar ihop med b"".join.
+_XML_HEAD, _rest = _QUERY_TEMPLATE.encode("utf-8").split(b"{api_key}")
+_XML_AFTER_KEY, _rest = _rest.split(b"{limit}")
+_XML_AFTER_LIMIT, _XML_TAIL = _rest.split(b"{filters}")
+del _rest
+
 def _build_query_xml(
     api_key: str,
     since_utc: dt.datetime,
@@ -64,9 +93,9 @@ def _build_query_xml(
     future_days_limit: Optional[int],
     lt_modified: Optional[str] = None,
     lt_publication: Optional[str] = None,
-) -> str:
+) -> bytes:
     """
-    Giltig Situation-fråga:
+    Giltig Situation-fråga (utf-8-kodad, skickas som den är):
     - Filtrerar på Situation.PublicationTime (inte Deviation.*)
     - Returnerar hela Deviation-noden (utan punktnotation)
     - Sorterar på Situation-fält
@@ -84,97 +113,172 @@ def _build_query_xml(
     if lt_publication:
         filters.append(f'<LT name="PublicationTime" value="{lt_publication}" />')
 
-    filters_xml = "\n      ".join(filters)
+    return b"".join((
+        _XML_HEAD, api_key.encode("utf-8"),
+        _XML_AFTER_KEY, str(limit).encode("ascii"),
+        _XML_AFTER_LIMIT, "\n      ".join(filters).encode("utf-8"),
+        _XML_TAIL,
+    ))
 
-    return f"""
-<REQUEST>
-  <LOGIN authenticationkey="{api_key}" />
-  <QUERY objecttype="Situation" schemaversion="1" limit="{limit}"
-         orderby="ModifiedTime desc, PublicationTime desc">
-    <FILTER>
-      {filters_xml}
-    </FILTER>
+# --------- Parsning & flatten ---------
+# Fält med få distinkta värden (tider, typ, väg, län) återkommer i många rader och sidor –
+# interneras så att raderna delar ett strängobjekt per värde (mindre minne, snabbare ==/hash
+# i dedupe och pandas). Unika fält (Id, Message) interneras inte.
+_intern = sys.intern
 
-    <INCLUDE>Id</INCLUDE>
-    <INCLUDE>ModifiedTime</INCLUDE>
-    <INCLUDE>PublicationTime</INCLUDE>
-    <INCLUDE>Deviation</INCLUDE>
-  </QUERY>
-</REQUEST>
-""".strip()
+def _first_children(e: ET.Element) -> Dict[str, ET.Element]:
+    """Första barnet per tagg i ett pass över barnen (samma val som findtext/find gör)."""
+    first: Dict[str, ET.Element] = {}
+    for child in e:
+        if child.tag not in first:
+            first[child.tag] = child
+    return first
 
-# --------- Parsning & flatten ---------
-def _flatten_situations(xml_text: str) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+def _text(first: Dict[str, ET.Element], tag: str) -> str:
+    el = first.get(tag)
+    return "" if el is None else (el.text or "").strip()
+
+def _situation_rows(s: ET.Element, now: dt.datetime) -> List[Dict[str, Any]]:
+    """En rad per Deviation under en Situation."""
+    # Ett pass över Situationens barn: toppfälten + Deviation-noderna i dokumentordning
+    top: Dict[str, ET.Element] = {}
+    deviations: List[ET.Element] = []
+    for child in s:
+        if child.tag == "Deviation":
+            deviations.append(child)
+        elif child.tag not in top:
+            top[child.tag] = child
+    situation_id = _text(top, "Id")
+    mod_time     = _intern(_text(top, "ModifiedTime"))
+    pub_time     = _intern(_text(top, "PublicationTime"))
+
+    rows: List[Dict[str, Any]] = []
+    for d in deviations:
+        # Tolerera saknade fält; ett pass över barnen i stället för en findtext-sökning per fält
+        f = _first_children(d)
+        dev_id   = _text(f, "Id")
+        msg      = _text(f, "Message")
+        mtype    = _intern(_text(f, "MessageType"))
+        loc_desc = _text(f, "LocationDescriptor")
+        road_no  = _intern(_text(f, "RoadNumber"))
+        county_no= _intern(_text(f, "CountyNo"))
+        start    = _intern(_text(f, "StartTime"))
+        end      = _intern(_text(f, "EndTime"))
+        wgs84    = ""
+        geom_node = f.get("Geometry")
+        if geom_node is not None:
+            wgs84 = (geom_node.findtext("WGS84") or "").strip()
+        lat, lon = _wgs84_to_latlon(wgs84)
+
+        status = _compute_status(start, end, now)
+
+        rows.append({
+            # nycklar som din Streamlit-app förväntar sig
+            "incident_id": dev_id or situation_id,
+            "message": msg,
+            "message_type": mtype,
+            "location_descriptor": loc_desc,
+            "road_number": road_no,
+            "county_name": "",          # CountyName saknas ofta i Deviation; kan härledas via CountyNo om du har tabell
+            "county_no": county_no,
+            "start_time_utc": start,
+            "end_time_utc": end,
+            "modified_time_utc": mod_time,
+            "latitude": lat,
+            "longitude": lon,
+            "status": status,
+            # ev. debug/metadata
+            "situation_id": situation_id,
+            "publication_time_utc": pub_time,
+        })
+    return rows
+
+def _situation_dict(s: ET.Element, now: dt.datetime) -> List[Dict[str, Any]]:
     """
-    Parsar XML-svar, flattenar varje Deviation under Situation till en rad.
-    Returnerar (rows, last_modified, last_publication) för pagination.
+    Situation som dict i API:ts egen form ({"Id", "ModifiedTime", "PublicationTime",
+    "Deviation": [{"Id", "Message", ..., "Geometry": {"WGS84"}}]}) – det transform.normalize_incidents
+    läser. Saknade fält blir None. En lista med ett element, så att den kan byggas som _situation_rows.
     """
-    root = ET.fromstring(xml_text)
-    situations = root.findall(".//Situation")
-    rows: List[Dict[str, Any]] = []
+    top: Dict[str, ET.Element] = {}
+    deviations: List[Dict[str, Any]] = []
+    for child in s:
+        if child.tag == "Deviation":
+            f = _first_children(child)
+            dev: Dict[str, Any] = {
+                "Id": _text(f, "Id") or None,
+                "Message": _text(f, "Message") or None,
+                "LocationDescriptor": _text(f, "LocationDescriptor") or None,
+            }
+            for tag in ("MessageType", "RoadNumber", "CountyNo", "StartTime", "EndTime"):
+                dev[tag] = _intern(_text(f, tag)) or None
+            geom_node = f.get("Geometry")
+            wgs84 = (geom_node.findtext("WGS84") or "").strip() if geom_node is not None else ""
+            dev["Geometry"] = {"WGS84": wgs84 or None}
+            deviations.append(dev)
+        elif child.tag not in top:
+            top[child.tag] = child
+    return [{
+        "Id": _text(top, "Id") or None,
+        "ModifiedTime": _intern(_text(top, "ModifiedTime")) or None,
+        "PublicationTime": _intern(_text(top, "PublicationTime")) or None,
+        "Deviation": deviations,
+    }]
 
-    for s in situations:
-        situation_id = (s.findtext("Id") or "").strip()
-        mod_time     = (s.findtext("ModifiedTime") or "").strip()
-        pub_time     = (s.findtext("PublicationTime") or "").strip()
-
-        deviations = s.findall("Deviation") or []
-        for d in deviations:
-            # Tolerera saknade fält
-            dev_id   = (d.findtext("Id") or "").strip()
-            msg      = (d.findtext("Message") or "").strip()
-            mtype    = (d.findtext("MessageType") or "").strip()
-            loc_desc = (d.findtext("LocationDescriptor") or "").strip()
-            road_no  = (d.findtext("RoadNumber") or "").strip()
-            county_no= (d.findtext("CountyNo") or "").strip()
-            start    = (d.findtext("StartTime") or "").strip()
-            end      = (d.findtext("EndTime") or "").strip()
-            wgs84    = ""
-            geom_node = d.find("Geometry")
-            if geom_node is not None:
-                wgs84 = (geom_node.findtext("WGS84") or "").strip()
-            lat, lon = _wgs84_to_latlon(wgs84)
-
-            status = _compute_status(start, end)
-
-            rows.append({
-                # nycklar som din Streamlit-app förväntar sig
-                "incident_id": dev_id or situation_id,
-                "message": msg,
-                "message_type": mtype,
-                "location_descriptor": loc_desc,
-                "road_number": road_no,
-                "county_name": "",          # CountyName saknas ofta i Deviation; kan härledas via CountyNo om du har tabell
-                "county_no": county_no,
-                "start_time_utc": start,
-                "end_time_utc": end,
-                "modified_time_utc": mod_time,
-                "latitude": lat,
-                "longitude": lon,
-                "status": status,
-                # ev. debug/metadata
-                "situation_id": situation_id,
-                "publication_time_utc": pub_time,
-            })
-
-    # Cursor (från sista Situation i sidan – API:n levererar i orderby-ordning)
-    last_modified = situations[-1].findtext("ModifiedTime").strip() if situations else None
-    last_pub      = situations[-1].findtext("PublicationTime").strip() if situations else None
-    return rows, last_modified or None, last_pub or None
-
-# --------- Publikt API: paginerad generator ---------
-def iterate_incidents(
+def _parse_page(
+    xml_body: Union[bytes, str, Iterable[bytes]],
+    build: Callable[[ET.Element, dt.datetime], List[Dict[str, Any]]],
+) -> Tuple[List[Dict[str, Any]], Optional[str], Optional[str]]:
+    """
+    Pull-parsar ett svar och bygger poster per Situation med build (_situation_rows/_situation_dict).
+    Returnerar (poster, last_modified, last_publication) för pagination.
+
+    Tar emot hela svaret (bytes/str) eller en ström av bytes-bitar (client.post_stream).
+    Varje bit matas till en pull-parser och färdiga Situation läses ut direkt efter den:
+    de byggs och töms (elem.clear()), så att bara pågående Situation plus tomma skal
+    av de redan lästa ligger i minnet medan svaret laddas ner.
+    Råa bytes avkodas av expat enligt XML-deklarationen, utan omväg via str.
+    """
+    chunks = (xml_body,) if isinstance(xml_body, (bytes, str)) else xml_body
+    parser = ET.XMLPullParser(events=("end",))
+
+    items: List[Dict[str, Any]] = []
+    last_modified = last_pub = None
+    now = dt.datetime.now(dt.UTC)  # en gång per sida
+
+    def drain() -> None:
+        nonlocal last_modified, last_pub
+        for _, elem in parser.read_events():
+            if elem.tag != "Situation":
+                continue
+            items.extend(build(elem, now))
+            # Cursor (från sista Situation i sidan – API:n levererar i orderby-ordning)
+            last_modified = (elem.findtext("ModifiedTime") or "").strip()
+            last_pub      = (elem.findtext("PublicationTime") or "").strip()
+            elem.clear()
+
+    for chunk in chunks:
+        parser.feed(chunk)
+        drain()
+    parser.close()
+    drain()
+    return items, last_modified or None, last_pub or None
+
+# --------- Publikt API: paginerade generatorer ---------
+def _iterate_pages(
     client,
     since_utc: dt.datetime,
-    page_size: int = DEFAULT_PAGE_SIZE,
-    future_days_limit: Optional[int] = 14,
-    max_pages: int = 20,
-) -> Iterator[Dict[str, Any]]:
+    page_size: int,
+    future_days_limit: Optional[int],
+    max_pages: int,
+    build: Callable[[ET.Element, dt.datetime], List[Dict[str, Any]]],
+    select_new: Callable[[List[Dict[str, Any]]], List[Dict[str, Any]]],
+) -> Iterator[List[Dict[str, Any]]]:
     """
-    Hämtar Situation-sidor och yield:ar flattenade Deviation-rader.
-    Cursor-baserad pagination med LT på (ModifiedTime, PublicationTime).
+    Sidloopen som iterate_incident_pages och iterate_situation_pages delar: cursor-baserad
+    pagination med LT på (ModifiedTime, PublicationTime). build bygger sidans poster och
+    select_new plockar ut de ej tidigare sedda; slutar när en sida är tom, inte ger något nytt,
+    är kortare än page_size eller saknar cursor.
     """
-    seen_ids: set[str] = set()
     lt_modified: Optional[str] = None
     lt_publication: Optional[str] = None
 
@@ -187,20 +291,99 @@ def iterate_incidents(
             lt_modified=lt_modified,
             lt_publication=lt_publication,
         )
-        xml_text = client.post(xml)  # <-- TRVClient måste returnera XML-string
-        page_rows, lt_modified, lt_publication = _flatten_situations(xml_text)
+        # Strömmat svar när klienten stöder det (TRVClient/TRVClientHTTP2): parsningen går i takt
+        # med nedladdningen i stället för att hela sidan först läses in som bytes
+        post_stream = getattr(client, "post_stream", None)
+        xml_body = post_stream(xml) if post_stream else client.post(xml)
+        page_items, lt_modified, lt_publication = _parse_page(xml_body, build)
 
-        if not page_rows:
+        if not page_items:
             break
 
-        new_any = False
-        for r in page_rows:
-            rid = r.get("incident_id")
-            if rid and rid not in seen_ids:
-                seen_ids.add(rid)
-                new_any = True
-                yield r
+        new_items = select_new(page_items)
+        if new_items:
+            yield new_items
 
         # slutvillkor
-        if not new_any or len(page_rows) < page_size or not lt_modified:
+        if not new_items or len(page_items) < page_size or not lt_modified:
             break
+
+def iterate_incident_pages(
+    client,
+    since_utc: dt.datetime,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    future_days_limit: Optional[int] = 14,
+    max_pages: int = 20,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Hämtar Situation-sidor och yield:ar en lista med nya (ej tidigare sedda) Deviation-rader per sida,
+    så att anroparen kan normalisera och ladda sida för sida i stället för att samla allt i minnet.
+    Cursor-baserad pagination med LT på (ModifiedTime, PublicationTime).
+    """
+    seen_ids: set[str] = set()
+
+    def select_new(page_rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        nonlocal seen_ids
+        # Nya id:n med mängdoperationer i C; raderna plockas sedan i sidans ordning (första
+        # förekomsten per id, även om samma id förekommer flera gånger på sidan)
+        new_ids = {r.get("incident_id") for r in page_rows} - seen_ids
+        new_ids.discard(None)
+        new_ids.discard("")
+        seen_ids |= new_ids
+        new_rows: List[Dict[str, Any]] = []
+        if new_ids:
+            for r in page_rows:
+                rid = r.get("incident_id")
+                if rid in new_ids:
+                    new_ids.remove(rid)
+                    new_rows.append(r)
+        return new_rows
+
+    yield from _iterate_pages(client, since_utc, page_size, future_days_limit, max_pages,
+                              _situation_rows, select_new)
+
+def iterate_situation_pages(
+    client,
+    since_utc: dt.datetime,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    future_days_limit: Optional[int] = 14,
+    max_pages: int = 20,
+) -> Iterator[List[Dict[str, Any]]]:
+    """
+    Som iterate_incident_pages, men yield:ar Situation-dictar (se _situation_dict) – indata till
+    transform.normalize_incidents. Deviationer vars incident-id (Deviation-Id, annars
+    "SituationId:StartTime" som i normalize_incidents) redan setts tas bort; Situationer utan
+    några nya Deviationer hoppas över.
+    """
+    seen_ids: set[str] = set()
+
+    def select_new(page_sits: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        new_sits: List[Dict[str, Any]] = []
+        for sit in page_sits:
+            devs = []
+            for d in sit["Deviation"]:
+                key = d["Id"] or f"{sit['Id']}:{d['StartTime']}"
+                if key not in seen_ids:
+                    seen_ids.add(key)
+                    devs.append(d)
+            if devs:
+                sit["Deviation"] = devs
+                new_sits.append(sit)
+        return new_sits
+
+    yield from _iterate_pages(client, since_utc, page_size, future_days_limit, max_pages,
+                              _situation_dict, select_new)
+
+def iterate_incidents(
+    client,
+    since_utc: dt.datetime,
+    page_size: int = DEFAULT_PAGE_SIZE,
+    future_days_limit: Optional[int] = 14,
+    max_pages: int = 20,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Hämtar Situation-sidor och yield:ar flattenade Deviation-rader en och en
+    (se iterate_incident_pages).
+    """
+    for page in iterate_incident_pages(client, since_utc, page_size, future_days_limit, max_pages):
+        yield from page
@@ -1,6 +1,8 @@
 # src/trv/load_sqlite.py
 from __future__ import annotations
 import sqlite3
+from functools import lru_cache
+from itertools import chain
 import pandas as pd
 
 DDL_13 = """
@@ -17,13 +19,36 @@ CREATE TABLE IF NOT EXISTS incidents (
   modified_time_utc TIMESTAMP,
   latitude REAL,
   longitude REAL,
-  status TEXT
+  status TEXT,
+  message_lc TEXT,
+  loc_lc TEXT,
+  road_lc TEXT,
+  search_lc TEXT
 );
 CREATE INDEX IF NOT EXISTS ix_incidents_start    ON incidents(start_time_utc);
 CREATE INDEX IF NOT EXISTS ix_incidents_county   ON incidents(county_name);
 CREATE INDEX IF NOT EXISTS ix_incidents_modified ON incidents(modified_time_utc);
+-- status IN (...) + start_time_utc-intervall (appens standardfilter) i ett indexsök;
+-- ersätter det rena status-indexet, som är ett prefix av detta
+CREATE INDEX IF NOT EXISTS ix_incidents_status_start ON incidents(status, start_time_utc);
+DROP INDEX IF EXISTS ix_incidents_status;
+CREATE INDEX IF NOT EXISTS ix_incidents_road     ON incidents(road_number);
 """
 
+# Förberäknade gemener för fritextsökning i appen. Fylls med Pythons str.lower
+# (SQLite:s lower() viker bara ASCII, så å/ä/ö skulle annars inte matcha).
+LC_COLS = {
+    "message_lc": "message",
+    "loc_lc": "location_descriptor",
+    "road_lc": "road_number",
+}
+# En sammanslagen sökkolumn (message ␟ location ␟ road, gemener) för appens fritextsökning:
+# en LIKE i stället för tre. Avgränsaren \x1f förekommer inte i TRV-texterna, så träffar kan
+# inte spänna över två fält.
+SEARCH_COL = "search_lc"
+SEARCH_SRC = ("message", "location_descriptor", "road_number")
+SEARCH_SEP = "\x1f"
+
 COLS_13 = [
     "incident_id",
     "message",
@@ -44,8 +69,9 @@ UPSERT_SQL_13 = """
 INSERT INTO incidents(
   incident_id, message, message_type, location_descriptor, road_number,
   county_name, county_no, start_time_utc, end_time_utc, modified_time_utc,
-  latitude, longitude, status
-) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?)
+  latitude, longitude, status,
+  message_lc, loc_lc, road_lc, search_lc
+) VALUES (?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?,?)
 ON CONFLICT(incident_id) DO UPDATE SET
   message=excluded.message,
   message_type=excluded.message_type,
@@ -58,46 +84,138 @@ ON CONFLICT(incident_id) DO UPDATE SET
   modified_time_utc=excluded.modified_time_utc,
   latitude=excluded.latitude,
   longitude=excluded.longitude,
-  status=excluded.status;
+  status=excluded.status,
+  message_lc=excluded.message_lc,
+  loc_lc=excluded.loc_lc,
+  road_lc=excluded.road_lc,
+  search_lc=excluded.search_lc;
 """
 
+UPSERT_COLS = COLS_13 + list(LC_COLS) + [SEARCH_COL]
+_VALUES_ROW = "(" + ",".join("?" * len(UPSERT_COLS)) + ")"
+
+@lru_cache(maxsize=8)
+def _upsert_sql(n_rows: int) -> str:
+    """UPSERT_SQL_13 med n_rows radtupler i VALUES – en prepare och en planering per sats
+    i stället för per rad (executemany kör satsen om för varje tupel)."""
+    return UPSERT_SQL_13.replace("VALUES " + _VALUES_ROW, "VALUES " + ",".join([_VALUES_ROW] * n_rows), 1)
+
+def _lower(s):
+    return s.lower() if isinstance(s, str) else s
+
+def _connect(db_path: str) -> sqlite3.Connection:
+    """
+    Skrivanslutning för ETL:en. WAL medan anslutningen är öppen, så att appens skrivskyddade
+    anslutning läser utan att blockeras av en pågående upsert; _close byter tillbaka till
+    DELETE innan den stängs. synchronous=NORMAL räcker i WAL-läge; temp i minnet och
+    64 MB sidcache för index-uppdateringarna under en stor upsert.
+    """
+    con = sqlite3.connect(db_path)
+    con.execute("PRAGMA journal_mode=WAL")
+    con.execute("PRAGMA synchronous=NORMAL")
+    con.execute("PRAGMA temp_store=MEMORY")
+    con.execute("PRAGMA cache_size=-64000")
+    return con
+
+def _close(con: sqlite3.Connection) -> None:
+    """
+    Checkpointa och lämna filen i DELETE-läge innan anslutningen stängs. trafik.db committas av
+    nattjobbet: en fil i WAL-läge kräver skrivbar katalog (för -wal/-shm) även för läsare med
+    mode=ro, och en utcheckning utan de filerna kan då inte öppnas alls.
+    """
+    try:
+        con.execute("PRAGMA journal_mode=DELETE")
+    except sqlite3.OperationalError:
+        pass  # en annan anslutning håller filen – WAL ligger kvar tills nästa ETL-körning stänger
+    finally:
+        con.close()
+
+def _apply_schema(con: sqlite3.Connection) -> None:
+    """DDL + migrering av äldre databaser som saknar *_lc-/sökkolumnerna (lägg till + fyll i)."""
+    con.executescript(DDL_13)
+    have = {r[1] for r in con.execute("PRAGMA table_info(incidents)")}
+    missing = [c for c in (*LC_COLS, SEARCH_COL) if c not in have]
+    for c in missing:
+        con.execute(f"ALTER TABLE incidents ADD COLUMN {c} TEXT")
+    if missing:
+        con.create_function("py_lower", 1, _lower, deterministic=True)
+        blob = " || char(31) || ".join(f"COALESCE({src}, '')" for src in SEARCH_SRC)
+        con.execute(
+            "UPDATE incidents SET "
+            + ", ".join(f"{c} = py_lower({src})" for c, src in LC_COLS.items())
+            + f", {SEARCH_COL} = py_lower({blob})"
+        )
+
 def ensure_schema(db_path: str) -> None:
     """Skapa tabell + index om de saknas."""
-    con = sqlite3.connect(db_path)
+    con = _connect(db_path)
     try:
-        con.executescript(DDL_13)
+        _apply_schema(con)
         con.commit()
     finally:
-        con.close()
+        _close(con)
 
-def upsert_incidents(db_path: str, df: pd.DataFrame, batch_size: int = 500) -> None:
-    """Skriv bara de 13 kolumnerna som tabellen förväntar sig."""
+def analyze_incidents(db_path: str) -> None:
+    """Uppdatera planerarens statistik (sqlite_stat1), annars kan SQLite välja fel index för
+    appens status/start-/länsfilter."""
+    con = _connect(db_path)
+    try:
+        con.execute("ANALYZE incidents")
+        con.commit()
+    finally:
+        _close(con)
+
+def upsert_incidents(db_path: str, df: pd.DataFrame, batch_size: int = 500, analyze: bool = True) -> None:
+    """Skriv de 13 kolumnerna som tabellen förväntar sig (+ härledda *_lc-/sökkolumner).
+    batch_size är antal rader per INSERT-sats (begränsas av SQLite:s max antal parametrar).
+    Med analyze=False hoppas ANALYZE över – för anropare som laddar i flera omgångar och kör
+    analyze_incidents en gång på slutet."""
     if df.empty:
         return
 
-    # säkerställ kolumnerna finns
-    df = df.copy()
-    for c in COLS_13:
-        if c not in df.columns:
-            df[c] = None
-
-    # typer
-    df["county_no"] = pd.to_numeric(df["county_no"], errors="coerce").astype("Int64")
-    df["latitude"] = pd.to_numeric(df["latitude"], errors="coerce")
-    df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
-    
-    con = sqlite3.connect(db_path)
+    # bara de 13 kolumnerna (saknade blir NA) – ny frame, ingen kopia av övriga kolumner
+    df = df.reindex(columns=COLS_13)
+
+    # typer – de numeriska kolumnerna i ett pass
+    num_cols = ["county_no", "latitude", "longitude"]
+    df[num_cols] = df[num_cols].apply(pd.to_numeric, errors="coerce")
+    df["county_no"] = df["county_no"].astype("Int64")
+    for lc, src in LC_COLS.items():
+        df[lc] = df[src].map(_lower)
+    parts = [df[src].astype("string").fillna("") for src in SEARCH_SRC]
+    blob = parts[0]
+    for p in parts[1:]:
+        blob = blob + SEARCH_SEP + p
+    df[SEARCH_COL] = blob.str.lower()
+
+    con = _connect(db_path)
     try:
+        _apply_schema(con)
+        con.commit()
         cur = con.cursor()
-        cur.executescript(DDL_13)
 
-        rows = []
-        for record in df[COLS_13].itertuples(index=False, name=None):
-            clean = tuple(None if (v is pd.NA or pd.isna(v)) else v for v in record)
-            rows.append(clean)
+        # Hela framen på en gång: astype(object) ger Python-typer (int/float/str – inga numpy-skalärer
+        # som sqlite3 skulle lagra som BLOB) och where() byter NA/NaN mot None, båda vektoriserat.
+        out = df[UPSERT_COLS].astype(object)
+        rows = out.where(out.notna(), None).to_numpy().tolist()
+
+        # Flerrads-VALUES: batch_size rader per sats, men aldrig fler parametrar än SQLite tillåter
+        # (999 i äldre byggen, 32766 från 3.32)
+        try:
+            max_vars = con.getlimit(sqlite3.SQLITE_LIMIT_VARIABLE_NUMBER)
+        except AttributeError:  # Python < 3.11
+            max_vars = 999
+        per_stmt = max(1, min(batch_size, max_vars // len(UPSERT_COLS)))
 
-        for i in range(0, len(rows), batch_size):
-            cur.executemany(UPSERT_SQL_13, rows[i:i+batch_size])
-            con.commit()
+        # En transaktion för alla batchar: en commit (och en WAL-synk) per anrop i stället för per
+        # batch, och ett avbrott rullar tillbaka hela upserten i stället för att lämna den halv.
+        con.execute("BEGIN IMMEDIATE")
+        for i in range(0, len(rows), per_stmt):
+            chunk = rows[i:i+per_stmt]
+            cur.execute(_upsert_sql(len(chunk)), list(chain.from_iterable(chunk)))
+        con.commit()
     finally:
-        con.close()
+        _close(con)
+
+    if analyze:
+        analyze_incidents(db_path)
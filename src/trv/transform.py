@@ -1,10 +1,10 @@
 # src/trv/transform.py
 from __future__ import annotations
 import re
-import datetime as dt
-from datetime import timezone
 from typing import Any, Dict, List, Tuple
+import numpy as np
 import pandas as pd
+import shapely
 from shapely import wkt as shapely_wkt
 from shapely.geometry import Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon
 
@@ -14,13 +14,18 @@ COUNTY_MAP = {
     14:"Västra Götalands län",17:"Värmlands län",18:"Örebro län",19:"Västmanlands län",20:"Dalarnas län",
     21:"Gävleborgs län",22:"Västernorrlands län",23:"Jämtlands län",24:"Västerbottens län",25:"Norrbottens län"
 }
+# Län som tuple (index = länsnummer): int-nummer slås upp med ett index i stället för dict-hash
+_COUNTY_NAMES = tuple(COUNTY_MAP.get(i) for i in range(max(COUNTY_MAP) + 1))
+STATUS_ORDER = ["PÅGÅR", "KOMMANDE"]  # visningsordning
 
-def _to_utc_iso(s: str | None) -> str | None:
-    if not s: return None
-    try:
-        return dt.datetime.fromisoformat(s.replace("Z", "+00:00")).astimezone(timezone.utc).isoformat(timespec="seconds")
-    except Exception:
-        return None
+def _county_name(county_no: Any) -> str | None:
+    if type(county_no) is int and 0 <= county_no < len(_COUNTY_NAMES):
+        return _COUNTY_NAMES[county_no]
+    # strängar ("12" från XML) m.m. går via int() som tidigare
+    return COUNTY_MAP.get(int(county_no)) if county_no is not None else None
+
+_NUM_RE = re.compile(r"[-+]?\d+(?:\.\d+)?")  # reserv: första talparet ur WKT-text
+_ISO_SUFFIX = "+00:00"
 
 def _latlon_from_wkt(wkt_text: str | None) -> Tuple[float | None, float | None]:
     if not wkt_text or not isinstance(wkt_text, str):
@@ -40,98 +45,198 @@ def _latlon_from_wkt(wkt_text: str | None) -> Tuple[float | None, float | None]:
             return float(lat), float(lon)
     except Exception:
         pass
-    nums = re.findall(r"[-+]?\d+(?:\.\d+)?", wkt_text)
-    if len(nums) >= 2:
-        lon, lat = float(nums[0]), float(nums[1])
+    # bara de två första talen behövs – finditer slutar där i stället för att skanna hela texten
+    nums = _NUM_RE.finditer(wkt_text)
+    first, second = next(nums, None), next(nums, None)
+    if second is not None:
+        lon, lat = float(first.group()), float(second.group())
         return lat, lon
     return None, None
 
-def normalize_incidents(situations: List[Dict[str, Any]]) -> pd.DataFrame:
-    rows: List[Dict[str, Any]] = []
-    now = dt.datetime.now(timezone.utc)
+# GEOS-typ-id 0–6 (Point … MultiPolygon) får centroid; övrigt (t.ex. GeometryCollection)
+# och ogiltig WKT går radvis genom _latlon_from_wkt som tidigare.
+_MAX_CENTROID_TYPE_ID = 6
+
+def _latlon_from_wkt_many(wkts: List[Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """Som _latlon_from_wkt men för hela kolumnen: en from_wkt/centroid-körning i GEOS."""
+    n = len(wkts)
+    lat = np.full(n, np.nan)
+    lon = np.full(n, np.nan)
+    texts = np.array([w if isinstance(w, str) and w else None for w in wkts], dtype=object)
+    geoms = shapely.from_wkt(texts, on_invalid="ignore")
+    type_ids = shapely.get_type_id(geoms)  # -1 för None
+    ok = (type_ids >= 0) & (type_ids <= _MAX_CENTROID_TYPE_ID) & ~shapely.is_empty(geoms)
+    pts = geoms[ok]
+    is_point = type_ids[ok] == 0
+    pts[~is_point] = shapely.centroid(pts[~is_point])
+    lon[ok] = shapely.get_x(pts)
+    lat[ok] = shapely.get_y(pts)
+    # Reserv radvis: ogiltig WKT, GeometryCollection, tomma geometrier (regex på texten)
+    for i in np.flatnonzero(~ok & (texts != None)):  # noqa: E711 – elementvis jämförelse
+        la, lo = _latlon_from_wkt(texts[i])
+        if la is not None:
+            lat[i], lon[i] = la, lo
+    return lat, lon
+
+def _na_ints(n: int, dtype: type) -> pd.arrays.IntegerArray:
+    """Heltalskolumn med bara NA (nullable Int16/Int32): en bit-mask i stället för n objekt-None."""
+    return pd.arrays.IntegerArray(np.zeros(n, dtype=dtype), np.ones(n, dtype=bool))
+
+def _parse_utc(raw: List[Any]) -> pd.Series:
+    """ISO-tider → datetime64[UTC] trunkerat till hela sekunder; ogiltigt → NaT."""
+    ts = pd.to_datetime(pd.Series(raw, dtype=object), utc=True, errors="coerce", format="ISO8601")
+    return ts.dt.floor("s")
+
+def _iso_utc(ts: pd.Series) -> List[Any]:
+    """datetime64[UTC] → ISO-strängar ("YYYY-MM-DDTHH:MM:SS+00:00"), NaT → None."""
+    secs = ts.dt.tz_localize(None).to_numpy(dtype="datetime64[s]")
+    text = np.datetime_as_string(secs, unit="s")  # i C, snabbare än dt.strftime
+    missing = np.isnat(secs)
+    return [None if m else t + _ISO_SUFFIX for t, m in zip(text.tolist(), missing.tolist())]
+
+def normalize_incidents(
+    situations: List[Dict[str, Any]],
+    sort_for_display: bool = True,
+    seen: set | None = None,
+) -> pd.DataFrame:
+    """
+    Situation-dictar → en deduplicerad rad per incident (pågående och kommande).
+    sort_for_display=True sorterar PÅGÅR först och sedan på senast ändrad/start, som appen visar.
+    Anropare som bara skriver vidare (SQLite-upsert m.m.) kan skicka False och slippa sorteringen.
+    seen: mängd med (message, location, start, end) som delas mellan anrop – en anropare som
+    normaliserar sida för sida skickar samma mängd, så att exakta dubbletter mellan sidorna
+    hoppas över precis som när hela hämtningen normaliseras i ett anrop.
+    """
+    # Kolumnvis uppbyggnad (en lista per kolumn) i stället för en dict per rad:
+    # ingen nyckelhashning per rad och DataFrame:n får sina dtypes direkt per kolumn.
+    incident_ids: List[Any] = []; situation_ids: List[Any] = []; deviation_ids: List[Any] = []
+    messages: List[str] = []; message_types: List[Any] = []; location_descriptors: List[Any] = []
+    road_numbers: List[Any] = []; county_nos: List[Any] = []
+    start_raw: List[Any] = []; end_raw: List[Any] = []; modified_raw: List[Any] = []
+    wkts: List[Any] = []
+    if seen is None:
+        seen = set()  # (message, location, start, end) – exakta dubbletter hoppas över direkt
 
     for sit in situations:
         situation_id = sit.get("Id")
-        modified_utc = _to_utc_iso(sit.get("ModifiedTime"))
+        modified = sit.get("ModifiedTime")
         deviations = sit.get("Deviation") or []
         for d in deviations:
             msg = (d.get("Message") or "").strip()
             if not msg:
                 continue
-            deviation_id = d.get("Id")
-            incident_id = deviation_id or f"{situation_id}:{d.get('StartTime')}"
-            start_utc = _to_utc_iso(d.get("StartTime"))
-            end_utc   = _to_utc_iso(d.get("EndTime"))
-            start_dt = dt.datetime.fromisoformat(start_utc) if start_utc else None
-            end_dt   = dt.datetime.fromisoformat(end_utc) if end_utc else None
-
-            if start_dt and start_dt > now:
-                status = "KOMMANDE"
-            elif (not start_dt or start_dt <= now) and (not end_dt or end_dt > now):
-                status = "PÅGÅR"
-            else:
+            key = (msg, d.get("LocationDescriptor"), d.get("StartTime"), d.get("EndTime"))
+            if key in seen:
                 continue
-
-            wkt = (d.get("Geometry") or {}).get("WGS84")
-            lat, lon = _latlon_from_wkt(wkt)
-
-            county_no = d.get("CountyNo")
-            if isinstance(county_no, list) and county_no:
-                county_no = county_no[0]
-            county_name = COUNTY_MAP.get(int(county_no)) if county_no is not None else None
-
-            rows.append({
-                "incident_id": incident_id,
-                "situation_id": situation_id,
-                "deviation_id": deviation_id,
-                "message": msg,
-                "message_type": d.get("MessageType"),
-                "location_descriptor": d.get("LocationDescriptor"),
-                "road_number": d.get("RoadNumber"),
-                "county_no": county_no,
-                "county_name": county_name,
-                "start_time_utc": start_utc,
-                "end_time_utc": end_utc,
-                "latitude": lat,
-                "longitude": lon,
-                "geometry_wgs84": wkt,
-                "severity_code": None,
-                "icon_id": None,
-                "created_time_utc": start_utc,
-                "modified_time_utc": modified_utc,
-                "status": status,
-            })
-
-    df = pd.DataFrame(rows)
-
-    if df.empty:
-        return df
-
-    # dedupe & sort – samma som i monoliten
+            seen.add(key)
+            deviation_id = d.get("Id")
+            incident_ids.append(deviation_id or f"{situation_id}:{d.get('StartTime')}")
+            situation_ids.append(situation_id)
+            deviation_ids.append(deviation_id)
+            messages.append(msg)
+            message_types.append(d.get("MessageType"))
+            location_descriptors.append(d.get("LocationDescriptor"))
+            road_numbers.append(d.get("RoadNumber"))
+            county_nos.append(d.get("CountyNo"))  # lista packas upp efter filtreringen
+
+            start_raw.append(d.get("StartTime"))
+            end_raw.append(d.get("EndTime"))
+            modified_raw.append(modified)
+            wkts.append((d.get("Geometry") or {}).get("WGS84"))
+
+    if not incident_ids:
+        return pd.DataFrame()
+
+    # Tider och status vektoriserat: en to_datetime per kolumn och booleska masker
+    # i stället för datetime-objekt och if-kedja per rad.
+    start_ts = _parse_utc(start_raw)
+    end_ts = _parse_utc(end_raw)
+    now = pd.Timestamp.now(tz="UTC")
+    kommande = (start_ts > now).to_numpy()
+    pagar = ~kommande & ((start_ts.isna() | (start_ts <= now)) & (end_ts.isna() | (end_ts > now))).to_numpy()
+    keep = kommande | pagar  # avslutade händelser tas bort
+    if not keep.any():
+        return pd.DataFrame()
+
+    # Strängformatering, länsnamn och koordinater bara för raderna som behålls
+    kept = np.flatnonzero(keep)
+    if len(kept) < len(keep):
+        (incident_ids, situation_ids, deviation_ids, messages, message_types,
+         location_descriptors, road_numbers, county_nos, modified_raw, wkts) = (
+            [col[i] for i in kept] for col in (
+                incident_ids, situation_ids, deviation_ids, messages, message_types,
+                location_descriptors, road_numbers, county_nos, modified_raw, wkts,
+            )
+        )
+        start_ts, end_ts = start_ts.iloc[kept], end_ts.iloc[kept]
+    modified_ts = _parse_utc(modified_raw)
+    start_times = _iso_utc(start_ts)
+    # CountyNo är en lista i JSON men en sträng i de flattenade XML-raderna: första elementet ur
+    # icke-tomma listor, övrigt oförändrat (bara för behållna rader)
+    county_nos = [c[0] if type(c) is list and c else c for c in county_nos]
+    names, n_names = _COUNTY_NAMES, len(_COUNTY_NAMES)
+    n_rows = len(incident_ids)
+    lat, lon = _latlon_from_wkt_many(wkts)  # float64 direkt, NaN för saknade
+
+    df = pd.DataFrame({
+        "incident_id": incident_ids,
+        "situation_id": situation_ids,
+        "deviation_id": deviation_ids,
+        "message": pd.array(messages, dtype="string"),  # strippad i loopen, slutlig dtype direkt
+        "message_type": message_types,
+        "location_descriptor": location_descriptors,
+        "road_number": road_numbers,
+        "county_no": county_nos,
+        "county_name": pd.Categorical(
+            [names[c] if type(c) is int and 0 <= c < n_names else _county_name(c)
+             for c in county_nos]  # int-fallet inline (ingen funktionsanropskostnad)
+        ),
+        "start_time_utc": start_times,
+        "end_time_utc": _iso_utc(end_ts),
+        "latitude": lat,
+        "longitude": lon,
+        "geometry_wgs84": wkts,
+        "severity_code": _na_ints(n_rows, np.int16),  # lämnas inte av TRV – typad NA, inte objekt-None
+        "icon_id": _na_ints(n_rows, np.int32),
+        "created_time_utc": start_times,
+        "modified_time_utc": _iso_utc(modified_ts),
+        # ordnad Categorical direkt från masken: kod 0 = PÅGÅR, 1 = KOMMANDE (STATUS_ORDER)
+        "status": pd.Categorical.from_codes(kommande[kept].astype(np.int8), categories=STATUS_ORDER, ordered=True),
+        # redan tolkade tider behålls för sorteringen nedan (ingen ny strängtolkning)
+        "_mod_dt": modified_ts.array,
+        "_start_dt": start_ts.array,
+    })
+
+    # dedupe & sort – samma som i monoliten (exakta dubbletter är redan bortfiltrerade i loopen;
+    # här fångas de som bara skiljer sig i tidsformat, t.ex. "Z" mot "+00:00")
     df = df.drop_duplicates(
         subset=["message","location_descriptor","start_time_utc","end_time_utc"],
         keep="first"
     )
 
-    df["_mod_dt"] = pd.to_datetime(df["modified_time_utc"], errors="coerce")
-    df = df.sort_values(by=["incident_id","_mod_dt"], ascending=[True, False]) \
-           .drop_duplicates(subset=["incident_id"], keep="first")
-
-    # sortera: PÅGÅR först, sen KOMMANDE
-    df["_start_dt"] = pd.to_datetime(df["start_time_utc"], errors="coerce")
-    status_rank = {"PÅGÅR": 0, "KOMMANDE": 1}
-    df["status_rank"] = df["status"].map(status_rank).fillna(9)
-    df = df.sort_values(
-        by=["status_rank","_mod_dt","_start_dt"],
-        ascending=[True, False, False]
-    ).drop(columns=["status_rank","_mod_dt","_start_dt"])
+    # senast ändrade raden per incident_id: en hash-gruppering i stället för global sortering.
+    # NaT fylls med minsta tid så att en känd tid vinner; vid lika vinner första raden.
+    mod_key = df["_mod_dt"].fillna(pd.Timestamp.min.tz_localize("UTC"))
+    df = df.loc[mod_key.groupby(df["incident_id"], sort=False).idxmax()]
+
+    if sort_for_display:
+        # sortera: PÅGÅR först, sen KOMMANDE – ordnad Categorical sorteras på heltalskoderna
+        # (incident_id sist som avgörare – samma ordning som den tidigare id-sorterade dedupen gav)
+        df = df.sort_values(
+            by=["status","_mod_dt","_start_dt","incident_id"],
+            ascending=[True, False, False, True],
+            kind="stable",
+        )
+    df = df.drop(columns=["_mod_dt","_start_dt"])
 
     # typer
     if "county_no" in df: df["county_no"] = pd.to_numeric(df["county_no"], errors="coerce").astype("Int64")
-    if "latitude"  in df: df["latitude"]  = pd.to_numeric(df["latitude"], errors="coerce")
-    if "longitude" in df: df["longitude"] = pd.to_numeric(df["longitude"], errors="coerce")
 
-    for c in ["message","message_type","location_descriptor","county_name","road_number","status"]:
-        if c in df: df[c] = df[c].astype("string").str.strip()
+    # message, county_name och status har sina slutliga dtypes från konstruktionen ovan;
+    # bara råfälten från TRV behöver .str.strip(). Få distinkta värden (län, status, typ, väg)
+    # → category: strängarna lagras en gång och filter/groupby går på heltalskoder.
+    df["location_descriptor"] = df["location_descriptor"].astype("string").str.strip()
+    for c in ["message_type","road_number"]:
+        df[c] = df[c].astype("string").str.strip().astype("category")
 
     return df
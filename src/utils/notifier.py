@@ -1,32 +1,70 @@
 # src/utils/notifier.py
-import os, json, requests, logging
-from dotenv import load_dotenv
-try:
-    import streamlit as st
-except Exception:
-    st = None
+import atexit, os, json, queue, requests, logging, threading
+from functools import lru_cache
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
-load_dotenv()
+logger = logging.getLogger("notifier")
 
-SLACK_WEBHOOK_URL = (
-    (st.secrets.get("SLACK_WEBHOOK_URL") if st else None)
-    or os.getenv("SLACK_WEBHOOK_URL")
-)
-SLACK_NOTIFY_USER = (
-    (st.secrets.get("SLACK_NOTIFY_USER") if st else None)
-    or os.getenv("SLACK_NOTIFY_USER")
-)
+@lru_cache(maxsize=1)
+def _load_env() -> None:
+    try:
+        from dotenv import load_dotenv
+        load_dotenv()
+    except ImportError:
+        pass
 
-logger = logging.getLogger("notifier")
+@lru_cache(maxsize=None)
+def _setting(name: str) -> str | None:
+    """
+    Streamlit secret, else environment (.env loaded once, on first use). Resolved lazily and
+    cached, so importing the notifier pulls in neither dotenv nor streamlit.
+    """
+    _load_env()
+    try:
+        import streamlit as st
+        value = st.secrets.get(name)
+    except Exception:  # no streamlit / no secrets.toml
+        value = None
+    return value or os.getenv(name)
+
+def _webhook_url() -> str | None:
+    return _setting("SLACK_WEBHOOK_URL")
+
+# orjson (optional) serializes straight to UTF-8 bytes; stdlib json is the fallback
+try:
+    import orjson
+
+    def _dumps(payload: dict) -> bytes:
+        return orjson.dumps(payload)
+except ImportError:
+    def _dumps(payload: dict) -> bytes:
+        return json.dumps(payload).encode("utf-8")
+
+# One keep-alive session for all posts: the TLS handshake to Slack is paid once per process.
+# Short retry on rate limits/gateway errors; timeout=10 applies per attempt.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(
+    pool_connections=1,
+    pool_maxsize=4,
+    max_retries=Retry(
+        total=2,
+        backoff_factor=0.2,
+        status_forcelist=(429, 502, 503, 504),
+        allowed_methods=frozenset(["POST"]),
+        raise_on_status=False,
+    ),
+))
 
 def _safe_post(payload: dict) -> dict:
     """Send JSON payload to Slack webhook; always return a status dict."""
-    if not SLACK_WEBHOOK_URL:
+    webhook_url = _webhook_url()
+    if not webhook_url:
         return {"sent": False, "configured": False, "status": None, "error": "no_webhook"}
     try:
-        resp = requests.post(
-            SLACK_WEBHOOK_URL,
-            data=json.dumps(payload),
+        resp = _SESSION.post(
+            webhook_url,
+            data=_dumps(payload),
             headers={"Content-Type": "application/json"},
             timeout=10,
         )
@@ -40,12 +78,52 @@ def _safe_post(payload: dict) -> dict:
     except Exception as e:
         return {"sent": False, "configured": True, "status": None, "error": str(e)}
 
-def notify(text: str, level: str = "info", ping: bool = False, ping_user: bool = False) -> dict:
+# Background delivery: notify() enqueues and returns, a daemon worker posts to Slack.
+# The queue is drained at interpreter exit (see flush), so the final messages of a run
+# (e.g. the error notice before the CLI re-raises) are still delivered.
+_QUEUE: "queue.Queue[dict | threading.Event]" = queue.Queue(maxsize=256)
+_worker: threading.Thread | None = None
+_worker_lock = threading.Lock()
+
+def _drain() -> None:
+    while True:
+        item = _QUEUE.get()
+        if isinstance(item, threading.Event):  # flush marker
+            item.set()
+            continue
+        result = _safe_post(item)
+        if not result["sent"]:
+            logger.warning("Slack notification failed: %s", result["error"] or result["status"])
+
+def _ensure_worker() -> None:
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_drain, name="slack-notifier", daemon=True)
+            _worker.start()
+            atexit.register(flush)
+
+def flush(timeout: float = 10.0) -> bool:
+    """Wait up to `timeout` seconds for queued notifications to be posted; True if drained."""
+    if _worker is None:
+        return True
+    marker = threading.Event()
+    try:
+        _QUEUE.put(marker, timeout=timeout)
+    except queue.Full:
+        return False
+    return marker.wait(timeout)
+
+def notify(text: str, level: str = "info", ping: bool = False, ping_user: bool = False,
+           wait: bool = False) -> dict:
     """
     Send notification to Slack + local log.
     - ping=True adds <!here> to trigger channel notifications.
     - ping_user=True adds <@USERID> if SLACK_NOTIFY_USER is set.
-    Always returns a dict from _safe_post.
+    - wait=True posts synchronously; otherwise the post is queued for the background worker
+      (the returned dict then has sent=None, queued=True). A full queue falls back to a
+      synchronous post.
+    Always returns a status dict.
     """
     emojis = {"info": "ℹ️", "warning": "⚠️", "error": "🚨", "success": "✅"}
     emoji = emojis.get(level, "ℹ️")
@@ -53,12 +131,21 @@ def notify(text: str, level: str = "info", ping: bool = False, ping_user: bool =
     prefix = ""
     if ping:
         prefix += "<!here> "
-    if ping_user and SLACK_NOTIFY_USER:
-        prefix += f"<@{SLACK_NOTIFY_USER}> "
+    notify_user = _setting("SLACK_NOTIFY_USER") if ping_user else None
+    if notify_user:
+        prefix += f"<@{notify_user}> "
 
     message = f"{emoji} {prefix}{text}"
 
     # local log
     (logger.error if level == "error" else logger.warning if level == "warning" else logger.info)(message)
 
-    return _safe_post({"text": message, "mrkdwn": True})
+    payload = {"text": message, "mrkdwn": True}
+    if wait or not _webhook_url():
+        return _safe_post(payload)
+    _ensure_worker()
+    try:
+        _QUEUE.put_nowait(payload)
+    except queue.Full:
+        return _safe_post(payload)
+    return {"sent": None, "configured": True, "status": None, "error": None, "queued": True}